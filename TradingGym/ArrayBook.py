@@ -0,0 +1,65 @@
+from TradingGym.OrderBook import OrderBook
+import numpy as np
+
+
+class ArrayBook:
+    """
+    Implements trader's order book as preallocated slots of (price, volume) per side,
+    best first, slots [first[side], count[side]) are live; filled slots are skipped by
+    moving first, so nothing is allocated while the book is quoted and matched
+    """
+    def __init__(self, levels=1):
+        self.levels = levels
+        self.prices = np.full((2, levels), np.nan)
+        self.volumes = np.zeros((2, levels))
+        self.first = [0, 0]
+        self.count = [0, 0]
+        # views of the first c slots of every side
+        self.__views = [[(self.prices[side, :c], self.volumes[side, :c]) for c in range(levels + 1)] for side in range(2)]
+
+    def clear(self):
+        for side in range(2):
+            self.first[side] = 0
+            self.count[side] = 0
+
+    def post(self, side, count):
+        """Make slots [0, count) of side live, their prices and volumes are written already"""
+        self.first[side] = 0
+        self.count[side] = count
+
+    def slots(self, side):
+        """Arrays of prices and volumes of slots [0, count) of side, changed in place by matching"""
+        return self.__views[side][self.count[side]]
+
+    def commissions(self, old, rate):
+        """Commissions of replacing old book with this one, summed in the order of TradingEnv.commissions"""
+        acc = 0.0
+        # item gives Python floats, cheaper than numpy scalars for a few slots
+        prices, volumes, old_prices, old_volumes = self.prices.item, self.volumes.item, old.prices.item, old.volumes.item
+        for side in range(2):
+            new_first, new_count = self.first[side], self.count[side]
+            old_first, old_count = old.first[side], old.count[side]
+            for i in range(old_first, old_count):
+                price = old_prices(side, i)
+                new = 0
+                for j in range(new_first, new_count):
+                    if prices(side, j) == price:
+                        new = volumes(side, j)
+                        break
+                acc += abs(old_volumes(side, i) - new) * rate
+            for j in range(new_first, new_count):
+                price = prices(side, j)
+                for i in range(old_first, old_count):
+                    if old_prices(side, i) == price:
+                        break
+                else:
+                    acc += abs(volumes(side, j)) * rate
+        return acc
+
+    def orderBook(self):
+        """OrderBook of live slots"""
+        book = OrderBook()
+        for side in range(2):
+            for i in range(self.first[side], self.count[side]):
+                book.book[side][float(self.prices[side, i])] = float(self.volumes[side, i])
+        return book
@@ -1,9 +1,18 @@
 from TradingGym.OrderFlow import OrderFlow
 from TradingGym.OrderBook import OrderBook
-from pandas import Timedelta
+from TradingGym.QueueBook import QueueBook
+from TradingGym.Pipeline import PipelinedBook
+from TradingGym.Tape import Tape
+from TradingGym.History import History
+from TradingGym.Recorder import Recorder
+from TradingGym.Matching import matchDeal, crossBook
+from TradingGym.Strategy import EventStrategy
+from TradingGym.Flags import ADD, BUY, SNAPSHOT, END_OF_TRANSACTION
+from pandas import Timedelta, Timestamp
 import numpy as np
 import math
 import time
+import bisect
 from tqdm import tqdm
 import sys
 
@@ -12,48 +21,56 @@ class Backtester:
     """
     Implements strategy tester in terms of PnL
     """
-    def __init__(self, flow, strategy):
+    def __init__(self, flow, strategy, tape=None, copy=False):
+        # source data is shared read-only, copy=True is only needed to mutate flow.df meanwhile
         self.flow = OrderFlow()
-        self.flow.df = flow.df.copy(deep=True)
+        if flow is not None:
+            self.flow.df = flow.df.copy(deep=True) if copy else flow.df
+        self.tape = tape # Tape of flow, built by run if not given, flow may be None then
         self.strategy = strategy
+        self.verbose = True # progress bar and start/end prints
         
-        self.ts = []
-        self.position = []
-        self.r_pnl = []
-        self.ur_pnl = []
-        self.price = []
+        self.recorder = Recorder() # set its every or capacity to thin out long runs
+        self.ts = self.recorder.ts
+        self.position = self.recorder.position
+        self.r_pnl = self.recorder.r_pnl
+        self.ur_pnl = self.recorder.ur_pnl
+        self.price = self.recorder.price
         self.commission = 0.0002
         self.max_length = 10**6
         self.trader_book = OrderBook()
         self.strongPriority = False # trader's orders are matched first if True
+        self.exactLiquidation = False # unrealized PnL is liquidation value by prefix search of book depth if True
+        self.queuePriority = False # trader's orders are filled by queue position in QueueBook if True, run only
+        self.profiler = None # Profiler timing phases of run if set
+        self.pipeline = False # market book is fed by a decoding producer thread if True, not with queuePriority
         
     def commissions(self, book1, book2):
+        # changed volume of every level of old book, then levels new in book2
         acc = 0.0
-        book_tmp = OrderBook()
-        book_tmp.book = (book1.book[0].copy(), book1.book[1].copy())
         for i in range(2):
-            for price, amount in book2.book[i].items():
-                if price in book_tmp.book[i]:
-                    book_tmp.book[i][price] -= amount
-                else:
-                    book_tmp.book[i][price] = -amount
-        for i in range(2):
-            for price, amount in book_tmp.book[i].items():
-                acc += abs(amount) * self.commission
+            old, new = book1.book[i], book2.book[i]
+            for price, amount in old.items():
+                acc += abs(amount - new.get(price, 0)) * self.commission
+            for price, amount in new.items():
+                if price not in old:
+                    acc += abs(amount) * self.commission
         return acc
     
     def unrealizedPnl(self, book):
         # assuming full discharge of position now
         position = self.position[-1]
+        if self.exactLiquidation:
+            return book.liquidation(0, position) if position > 0 else -book.liquidation(1, -position)
         ret = 0.0
         if position > 0:
-            for price, value in sorted(book.book[0].items(), reverse=True):
+            for price, value in book.levels(0):
                 if position <= 0.0:
                     break
                 position -= value
                 ret += price * max(value, position)
         else:
-            for price, value in sorted(book.book[1].items(), reverse=False):
+            for price, value in book.levels(1):
                 if position >= 0.0:
                     break
                 position += value
@@ -61,38 +78,24 @@ class Backtester:
         return ret
 
     def finalize_book(self, book, new_book):
-        for price, value in sorted(book.book[1].items(), reverse=False):
-            bestBid = new_book.bestBid()
-            if bestBid[0] < price or math.isnan(bestBid[0]):
-                break
-            if bestBid[1] > value:
-                self.position[-1] += value
-                new_book.book[0][bestBid[0]] -= value
-            else:
-                self.position[-1] += bestBid[1]
-                del new_book.book[0][bestBid[0]]
-        for price, value in sorted(book.book[0].items(), reverse=True):
-            bestAsk = new_book.bestAsk()
-            if bestAsk[0] > price or math.isnan(bestAsk[0]):
-                break
-            if bestAsk[1] > value:
-                self.position[-1] -= value
-                new_book.book[1][bestAsk[0]] -= value
-            else:
-                self.position[-1] -= bestAsk[1]
-                del new_book.book[1][bestAsk[0]]
-
+        self.position[-1] = crossBook(book, new_book, self.position[-1])
         return new_book
         
-    def run(self, max_length = 10**6):
+    def handleDeal(self, book, new_book, buySell, deal_amount, deal_price):
+        # unfilled rest of deal is assumed to be FillOrKill
+        self.position[-1], self.r_pnl[-1] = matchDeal(book, new_book, buySell, deal_amount, deal_price,
+            self.position[-1], self.r_pnl[-1], self.strongPriority)
+
+    def runReference(self, max_length = 10**6):
+        """Reference implementation of run which walks the data frame row by row"""
         self.max_length = max_length
         
         deals = self.flow.df[self.flow.df.DealId != 0].drop_duplicates('ExchTime')
         book = OrderBook()
         used_idx = 0
         
-        right_before_trading = self.flow.df[self.flow.df.Flags.str.contains('Snapshot')].iloc[-1]
-        trading_start = self.flow.df[self.flow.df.Flags.str.contains('Add') & (self.flow.df.index > right_before_trading.name)].iloc[0]
+        right_before_trading = self.flow.df[(self.flow.df.Flags & SNAPSHOT) != 0].iloc[-1]
+        trading_start = self.flow.df[((self.flow.df.Flags & ADD) != 0) & (self.flow.df.index > right_before_trading.name)].iloc[0]
         trading_close_time = trading_start.ExchTime.round('h') + Timedelta('8h45m')
         trading_close_idx = self.flow.df.ExchTime.searchsorted(trading_close_time)[0] - 1
         trading_close = self.flow.df.iloc[trading_close_idx]
@@ -106,7 +109,7 @@ class Backtester:
         pbar = tqdm(total=total_idx, smoothing=0.01)
         progress = 0
         
-        self.ts.append(trading_start.ExchTime)
+        self.ts.append(trading_start.ExchTime.value)
         self.position.append(0.0)
         self.r_pnl.append(0.0)
         self.ur_pnl.append(0.0)
@@ -115,7 +118,7 @@ class Backtester:
         messages = self.flow.df.iloc[used_idx:idx]
         used_idx = idx
         book.updateBulk(messages)
-        self.price.append((max(book.book[0].keys()) + min(book.book[1].keys())) / 2)
+        self.price.append(book.midPrice())
         strategy_time = trading_start.ExchTime
         new_book, sleep = self.strategy.action(self.position[-1], 
                 self.flow.df.iloc[:idx], self.trader_book, book)
@@ -131,12 +134,12 @@ class Backtester:
             while (deal.ExchTime - strategy_time).value > sleep:
                 strategy_time += Timedelta(np.timedelta64(sleep, 'ms'))
                 
-                self.ts.append(strategy_time)
+                self.ts.append(strategy_time.value)
                 self.position.append(self.position[-1])
                 self.r_pnl.append(self.r_pnl[-1])
-                self.price.append((max(book.book[0].keys()) + min(book.book[1].keys())) / 2)
+                self.price.append(book.midPrice())
 
-                while (self.flow.df.iloc[idx].ExchTime < strategy_time or 'EndOfTransaction' not in self.flow.df.iloc[idx].Flags) and idx < name-1:
+                while (self.flow.df.iloc[idx].ExchTime < strategy_time or not self.flow.df.iloc[idx].Flags & END_OF_TRANSACTION) and idx < name-1:
                     message = self.flow.df.iloc[idx]
                     book.update(message)
                     idx += 1
@@ -152,64 +155,11 @@ class Backtester:
             used_idx = name-1
             book.updateBulk(messages)
             
-            buySell = 'Buy' in self.flow.df.iloc[name - 1].Flags
+            buySell = bool(self.flow.df.iloc[name - 1].Flags & BUY)
             deal_amount = self.flow.df.iloc[name - 1].Amount
             deal_price = self.flow.df.iloc[name - 1].Price
 
-            if buySell:
-                """Buy trader's asks"""
-                for price, amount in sorted(book.book[1].items(), reverse=False):
-                    bestAsk = new_book.bestAsk()
-                    if (bestAsk[0] > deal_price or bestAsk[0] == float('nan')) and price > deal_price:
-                        break
-                    if bestAsk[0] != float('nan') and (bestAsk[0] < price or (bestAsk[0] == price and self.strongPriority)):
-                        if bestAsk[1] >= deal_amount:
-                            new_book.book[1][bestAsk[0]] -= deal_amount
-                            
-                            self.position[-1] -= deal_amount
-                            self.r_pnl[-1] += deal_amount * bestAsk[0]
-                            
-                            deal_amount = 0
-                        else:
-                            del new_book.book[1][bestAsk[0]]
-                            
-                            self.position[-1] -= bestAsk[1]
-                            self.r_pnl[-1] += bestAsk[1] * bestAsk[0]
-                            
-                            deal_amount -= bestAsk[1]
-                    else:
-                        deal_amount -= amount
-                    if deal_amount <= 0:
-                        break
-                if deal_amount > 0:
-                    pass # assuming that order was FillOrKill
-            else:
-                """Sell trader's bids"""
-                for price, amount in sorted(book.book[0].items(), reverse=True):
-                    bestBid = new_book.bestBid()
-                    if (bestBid[0] < deal_price or bestBid[0] == float('nan')) and price < deal_price:
-                        break
-                    if bestBid[0] != float('nan') and (bestBid[0] > price or (bestBid[0] == price and self.strongPriority)):
-                        if bestBid[1] >= deal_amount:
-                            new_book.book[0][bestBid[0]] -= deal_amount
-                            
-                            self.position[-1] += deal_amount
-                            self.r_pnl[-1] -= deal_amount * bestBid[0]
-                            
-                            deal_amount = 0
-                        else:
-                            del new_book.book[0][bestBid[0]]
-                            
-                            self.position[-1] += bestBid[1]
-                            self.r_pnl[-1] -= bestBid[1] * bestBid[0]
-                            
-                            deal_amount -= bestBid[1]
-                    else:
-                        deal_amount -= amount
-                    if deal_amount <= 0:
-                        break
-                if deal_amount > 0:
-                    pass # assuming that order was FillOrKill
+            self.handleDeal(book, new_book, buySell, deal_amount, deal_price)
 
             self.trader_book = new_book
             self.ur_pnl[-1] = self.unrealizedPnl(book)
@@ -219,5 +169,265 @@ class Backtester:
                 
         pbar.close()
         
-        return [self.ts, self.position, self.r_pnl, self.ur_pnl, self.price]
-    
\ No newline at end of file
+        return self.recorder.columns()
+    
+    def handleFills(self, book, new_book):
+        """Execute trader's orders filled in QueueBook, replaces handleDeal if queuePriority is set"""
+        for side, price, amount in book.takeFills():
+            levels = new_book.book[side]
+            if levels[price] > amount:
+                levels[price] -= amount
+            else:
+                del levels[price]
+            sign = 1 if side == 0 else -1
+            self.position[-1] += sign * amount
+            self.r_pnl[-1] -= sign * amount * price
+
+    def __marketBook(self, tape):
+        if self.queuePriority:
+            return QueueBook()
+        if self.pipeline:
+            return PipelinedBook(tape)
+        return OrderBook()
+
+    def __bounds(self, tape):
+        # first message of trading after the snapshot and the last one run may reach
+        snapshots = np.flatnonzero(tape.flags & SNAPSHOT)
+        adds = np.flatnonzero(tape.flags & ADD)
+        start = int(adds[np.searchsorted(adds, snapshots[-1], side='right')])
+        trading_close_time = Timestamp(tape.ts[start]).round('h') + Timedelta('8h45m')
+        trading_close_idx = int(np.searchsorted(tape.ts, trading_close_time.value)) - 1
+        end = min(self.max_length + start - 1, trading_close_idx % len(tape))
+        return start, end
+
+    def run(self, max_length = 10**6):
+        """
+        Replays order flow from its columnar Tape, same output as runReference
+        except that strategies receive History cursor instead of data frame slice,
+        EventStrategy is replayed by runEvents
+        """
+        if isinstance(self.strategy, EventStrategy):
+            return self.runEvents(max_length)
+        self.max_length = max_length
+
+        if self.tape is None:
+            self.tape = Tape.fromFrame(self.flow.df)
+        tape = self.tape
+        deals = tape.deals()
+        book = self.__marketBook(tape)
+        if self.profiler is not None:
+            self.profiler.attach(self, book)
+        try:
+            start, end = self.__bounds(tape)
+            if self.verbose:
+                print('Started simulation from time: {}'.format(Timestamp(tape.ts[start])))
+                print('Planned end time: {}'.format(Timestamp(tape.ts[end])))
+                sys.stdout.flush()
+            pbar = tqdm(total=end - start, smoothing=0.01, disable=not self.verbose)
+            progress = 0
+
+            self.ts.append(int(tape.ts[start]))
+            self.position.append(0.0)
+            self.r_pnl.append(0.0)
+            self.ur_pnl.append(0.0)
+
+            book.updateRange(tape, 0, start)
+            used_idx = start
+            self.price.append(book.midPrice())
+            strategy_time = int(tape.ts[start])
+            history = History(tape, start)
+            new_book, sleep = self.strategy.action(self.position[-1],
+                    history, self.trader_book, book)
+            self.r_pnl[-1] -= self.commissions(self.trader_book, new_book)
+            new_book = self.finalize_book(book, new_book)
+            self.trader_book = new_book
+            if self.queuePriority:
+                book.setOrders(new_book)
+
+            for name in deals.tolist():
+                if name > end:
+                    break
+
+                idx = used_idx
+                deal_time = int(tape.ts[name])
+                while deal_time - strategy_time > sleep:
+                    strategy_time += sleep * 1000000
+
+                    self.ts.append(strategy_time)
+                    self.position.append(self.position[-1])
+                    self.r_pnl.append(self.r_pnl[-1])
+                    self.price.append(book.midPrice())
+
+                    next_idx = tape.nextTransaction(idx, name - 1, strategy_time)
+                    book.updateRange(tape, idx, next_idx)
+                    if self.queuePriority:
+                        self.handleFills(book, new_book)
+                    idx = used_idx = next_idx
+                    history.end = idx
+                    new_book, sleep = self.strategy.action(self.position[-1],
+                        history, self.trader_book, book)
+                    self.r_pnl[-1] -= self.commissions(self.trader_book, new_book)
+                    new_book = self.finalize_book(book, new_book)
+                    if self.queuePriority:
+                        book.setOrders(new_book)
+                    self.ur_pnl.append(self.unrealizedPnl(book))
+
+                assert(used_idx <= name-1)
+                book.updateRange(tape, used_idx, name - 1)
+                used_idx = name - 1
+
+                if self.queuePriority:
+                    self.handleFills(book, new_book)
+                else:
+                    flag = int(tape.flags[name - 1])
+                    self.handleDeal(book, new_book, bool(flag & BUY),
+                        int(tape.amount[name - 1]), int(tape.price[name - 1]))
+
+                self.trader_book = new_book
+                self.ur_pnl[-1] = self.unrealizedPnl(book)
+
+                pbar.update(used_idx - progress)
+                progress = used_idx
+
+            pbar.close()
+        finally:
+            if isinstance(book, PipelinedBook):
+                book.close()
+            if self.profiler is not None:
+                self.profiler.detach()
+
+        return self.recorder.columns()
+
+    def runEvents(self, max_length = 10**6):
+        """
+        Replays order flow transaction by transaction calling only the callbacks EventStrategy
+        overrides, time series get a record at every call and at every fill of trader's orders
+        """
+        self.max_length = max_length
+
+        if self.tape is None:
+            self.tape = Tape.fromFrame(self.flow.df)
+        tape = self.tape
+        strategy = self.strategy
+        book = self.__marketBook(tape)
+        if self.profiler is not None:
+            self.profiler.attach(self, book)
+        try:
+            start, end = self.__bounds(tape)
+            if self.verbose:
+                print('Started simulation from time: {}'.format(Timestamp(tape.ts[start])))
+                print('Planned end time: {}'.format(Timestamp(tape.ts[end])))
+                sys.stdout.flush()
+            pbar = tqdm(total=end - start, smoothing=0.01, disable=not self.verbose)
+            progress = 0
+
+            on_book = strategy.subscribed('onBookChange')
+            on_trade = strategy.subscribed('onTrade')
+            on_fill = strategy.subscribed('onFill')
+            timer = strategy.timer * 1000000 if strategy.subscribed('onTimer') and strategy.timer else None
+
+            def record(now):
+                self.ts.append(now)
+                self.position.append(self.position[-1])
+                self.r_pnl.append(self.r_pnl[-1])
+                self.ur_pnl.append(self.ur_pnl[-1])
+                self.price.append(book.midPrice())
+
+            def react(callback, *args):
+                # strategy call on the last record
+                new_book = callback(self.position[-1], history, self.trader_book, book, *args)
+                if new_book is not None:
+                    self.r_pnl[-1] -= self.commissions(self.trader_book, new_book)
+                    self.trader_book = self.finalize_book(book, new_book)
+                    if self.queuePriority:
+                        book.setOrders(self.trader_book)
+                self.ur_pnl[-1] = self.unrealizedPnl(book)
+
+            def filled(now, position, r_pnl):
+                # fill changed the last record, it gets a record of its own
+                if self.position[-1] == position:
+                    return
+                amount = self.position[-1] - position
+                price = (r_pnl - self.r_pnl[-1]) / amount
+                record(now)
+                self.position[-2] = position
+                self.r_pnl[-2] = r_pnl
+                self.ur_pnl[-1] = self.unrealizedPnl(book)
+                if on_fill:
+                    react(strategy.onFill, amount, price)
+
+            def top():
+                bids, asks = book.book
+                bid, ask = bids.best(), asks.best()
+                return bid, bids.get(bid), ask, asks.get(ask)
+
+            self.ts.append(int(tape.ts[start]))
+            self.position.append(0.0)
+            self.r_pnl.append(0.0)
+            self.ur_pnl.append(0.0)
+
+            book.updateRange(tape, 0, start)
+            self.price.append(book.midPrice())
+            history = History(tape, start)
+            react(strategy.onStart)
+            last_top = top()
+            next_timer = int(tape.ts[start]) + timer if timer else None
+
+            deals = tape.deals().tolist()
+            d = bisect.bisect_left(deals, start + 1)
+            eot = tape.endOfTransaction()
+            idx = start
+            for last in eot[np.searchsorted(eot, start):].tolist():
+                if idx > end:
+                    break
+                now = int(tape.ts[idx])
+                while next_timer is not None and next_timer < now:
+                    record(next_timer)
+                    history.end = idx
+                    react(strategy.onTimer)
+                    next_timer += timer
+
+                while d < len(deals) and deals[d] <= last:
+                    # deal at position d is matched right before message d-1 is applied to the book,
+                    # unless d starts a transaction and d-1 is applied with the previous one already
+                    deal = deals[d] - 1
+                    d += 1
+                    book.updateRange(tape, idx, max(deal, idx))
+                    idx = history.end = max(deal, idx)
+                    position, r_pnl = self.position[-1], self.r_pnl[-1]
+                    flag = int(tape.flags[deal])
+                    if self.queuePriority:
+                        self.handleFills(book, self.trader_book)
+                    else:
+                        self.handleDeal(book, self.trader_book, bool(flag & BUY),
+                            int(tape.amount[deal]), int(tape.price[deal]))
+                    filled(now, position, r_pnl)
+                    if on_trade:
+                        record(now)
+                        react(strategy.onTrade, bool(flag & BUY), int(tape.amount[deal]), int(tape.price[deal]))
+
+                book.updateRange(tape, idx, last + 1)
+                idx = history.end = last + 1
+                if self.queuePriority:
+                    position, r_pnl = self.position[-1], self.r_pnl[-1]
+                    self.handleFills(book, self.trader_book)
+                    filled(now, position, r_pnl)
+                if on_book:
+                    new_top = top()
+                    if new_top != last_top:
+                        last_top = new_top
+                        record(now)
+                        react(strategy.onBookChange)
+
+                if idx - progress >= 10**4:
+                    pbar.update(idx - progress)
+                    progress = idx
+
+            pbar.close()
+        finally:
+            if isinstance(book, PipelinedBook):
+                book.close()
+            if self.profiler is not None:
+                self.profiler.detach()
+
+        return self.recorder.columns()
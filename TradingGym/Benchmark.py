@@ -0,0 +1,331 @@
+"""
+Replay benchmarks on synthetic sessions:
+
+    python -m TradingGym.Benchmark --messages 100000 --output results.json --baseline benchmarks/baseline.json
+
+exits with status 1 if a result is worse than the baseline by more than the tolerance,
+or 2 if the baseline was run with other params
+"""
+from TradingGym.Flags import ADD, BUY, SNAPSHOT, END_OF_TRANSACTION, SELL, FILL, QUOTE, COUNTER, CANCELED, formatFlags, decodeFlags
+from TradingGym.OrderFlow import OrderFlow
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Pipeline import PipelinedBook
+from TradingGym.Tape import Tape
+from TradingGym.Strategy import Strategy, SpreadStrategy
+from TradingGym.Backtester import Backtester
+from pandas import Timestamp
+import pandas as pd
+import numpy as np
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+import shutil
+import json
+import time
+import sys
+import os
+
+def syntheticFlow(messages=10**5, levels=20, seed=0, day='2017-12-01', price=60000, tick=5, interval=20.0):
+    """
+    Data frame of Plaza II style session: snapshot of levels per side, then random adds,
+    cancels and trades of the best order, interval is mean ms between transactions
+    """
+    rng = np.random.RandomState(seed)
+    rows = []
+    sides = ({}, {}) # bids, asks: price -> list of [order id, amount] in arrival order
+    book = OrderBook()
+    live = [] # (order id, side, price) to pick random cancels
+    state = {'order_id': 1000, 'deal_id': 5000}
+
+    def add(t, side, price, amount, flags):
+        state['order_id'] += 1
+        order_id = state['order_id']
+        sides[side].setdefault(price, []).append([order_id, amount])
+        live.append((order_id, side, price))
+        book.updateValues(side == 0, True, price, amount)
+        rows.append((t, order_id, price, amount, amount, 0, 0, 0, flags | (BUY if side == 0 else SELL)))
+
+    def remove(side, price, order, amount):
+        order[1] -= amount
+        book.updateValues(side == 0, False, price, amount)
+        if order[1] == 0:
+            queue = sides[side][price]
+            queue.remove(order)
+            if not queue:
+                del sides[side][price]
+
+    t = Timestamp(day + ' 09:59:59').value
+    for level in range(1, levels + 1):
+        for side, sign in ((0, -1), (1, 1)):
+            t += 1000
+            add(t, side, price + sign * level * tick, int(rng.randint(1, 50)), ADD | SNAPSHOT | QUOTE | END_OF_TRANSACTION)
+    t = Timestamp(day + ' 10:00:00.050').value
+    while len(rows) < messages:
+        t += int(rng.exponential(interval * 1e6)) + 1
+        r = rng.rand()
+        side = int(rng.randint(2))
+        thin = len(sides[side]) < levels // 2
+        if r < 0.5 or thin:
+            # passive add up to levels ticks away from the best opposite price
+            best = book.bestAsk()[0] if side == 0 else book.bestBid()[0]
+            offset = (1 + (int(rng.geometric(0.3)) - 1) % levels) * tick
+            add(t, side, best - offset if side == 0 else best + offset, int(rng.randint(1, 30)), ADD | QUOTE | END_OF_TRANSACTION)
+        elif r < 0.8:
+            i = int(rng.randint(len(live)))
+            order_id, side, price = live[i]
+            queue = sides[side].get(price, [])
+            order = next((order for order in queue if order[0] == order_id), None)
+            live[i] = live[-1]
+            live.pop()
+            if order is None or len(sides[side]) < levels // 2:
+                continue
+            rows.append((t, order_id, price, order[1], 0, 0, 0, 0, CANCELED | QUOTE | END_OF_TRANSACTION | (BUY if side == 0 else SELL)))
+            remove(side, price, order, order[1])
+        else:
+            # aggressor of side takes part of the first order at the best opposite price
+            # or sometimes sweeps the best level and part of the next one
+            other = 1 - side
+            prices = book.top(other, 2)[0]
+            fills = []
+            if rng.rand() < 0.2 and len(prices) == 2:
+                fills = [(order, prices[0], order[1]) for order in sides[other][prices[0]]]
+            order = sides[other][prices[len(fills) > 0]][0]
+            fills.append((order, prices[len(fills) > 0], int(rng.randint(1, order[1] + 1))))
+            total = sum(amount for order, price, amount in fills)
+            aggressor = BUY if side == 0 else SELL
+            state['order_id'] += 1
+            limit = fills[-1][1]
+            rows.append((t, state['order_id'], limit, total, total, 0, 0, 0, ADD | COUNTER | aggressor))
+            for k, (order, price, amount) in enumerate(fills):
+                state['deal_id'] += 1
+                total -= amount
+                rows.append((t, order[0], price, amount, order[1] - amount, state['deal_id'], price, 100,
+                    FILL | QUOTE | (BUY if other == 0 else SELL)))
+                rows.append((t, state['order_id'], limit, amount, total, state['deal_id'], price, 100,
+                    FILL | COUNTER | aggressor | (END_OF_TRANSACTION if k == len(fills) - 1 else 0)))
+                remove(other, price, order, amount)
+
+    df = pd.DataFrame(rows[:messages], columns=['ExchTime', 'OrderId', 'Price', 'Amount', 'AmountRest', 'DealId', 'DealPrice', 'OI', 'Flags'])
+    df['ExchTime'] = pd.to_datetime(df['ExchTime'])
+    df.insert(0, 'Received', df['ExchTime'])
+    # flags as text like in converted qsh files
+    masks = df['Flags'].unique()
+    df['Flags'] = df['Flags'].map(dict(zip(masks, [formatFlags(mask) for mask in masks]))).astype(object)
+    return df
+
+def _rssMb():
+    # peak resident set size of the process, ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def _traced(function, steps):
+    # net allocated blocks and peak extra bytes per step of function, run under tracemalloc
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    current = tracemalloc.get_traced_memory()[0]
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {'retained_blocks_per_step': blocks / steps, 'peak_bytes_per_step': (peak - current) / steps}
+
+def benchOrderBook(df, tape, messages=20000):
+    """
+    OrderBook.updateBulk over data frame rows, updateRange over Tape at once and
+    transaction by transaction like a replay, the latter also with PipelinedBook
+    """
+    messages = min(messages, len(df))
+    book = OrderBook()
+    start = time.perf_counter()
+    book.updateBulk(decodeFlags(df.iloc[:messages].copy()))
+    bulk = time.perf_counter() - start
+    book = OrderBook()
+    start = time.perf_counter()
+    book.updateRange(tape, 0, len(tape))
+    replay = time.perf_counter() - start
+    ret = {'update_bulk_messages_per_sec': messages / bulk, 'update_range_messages_per_sec': len(tape) / replay}
+    ends = tape.endOfTransaction().tolist()
+    for name, book in (('transactions', OrderBook()), ('pipelined', PipelinedBook(tape))):
+        idx = 0
+        start = time.perf_counter()
+        for end in ends:
+            book.updateRange(tape, idx, end + 1)
+            idx = end + 1
+        ret['update_{}_messages_per_sec'.format(name)] = idx / (time.perf_counter() - start)
+        if isinstance(book, PipelinedBook):
+            book.close()
+    return ret
+
+def benchBacktester(tape, strategy):
+    """Backtester.run over the whole session"""
+    backtest = Backtester(None, strategy, tape=tape)
+    backtest.verbose = False
+    start = time.perf_counter()
+    ts = backtest.run(len(tape))[0]
+    seconds = time.perf_counter() - start
+    return {'messages_per_sec': len(tape) / seconds, 'steps_per_sec': len(ts) / seconds, 'seconds': seconds}
+
+def benchEnv(hdf_path, key, cache_dir, steps=2000, seed=0):
+    """TradingEnv init, reset and steps with random actions"""
+    from TradingGym.envs.trading_env import TradingEnv
+    rng = np.random.RandomState(seed)
+    actions = rng.randint(64, size=steps).tolist()
+    env = TradingEnv()
+    env.EPISODE = steps + 1
+    start = time.perf_counter()
+    env.init(hdf_path, key, cache_dir)
+    init = time.perf_counter() - start
+    start = time.perf_counter()
+    env.reset()
+    reset = time.perf_counter() - start
+
+    def run():
+        for action in actions:
+            env.step(action)
+
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    ret = {'init_seconds': init, 'reset_seconds': reset, 'steps_per_sec': steps / seconds}
+    env.init(hdf_path, key, cache_dir)
+    env.reset()
+    ret.update(_traced(run, steps))
+    return ret
+
+def benchOrderFlow(df, queries=1000, seed=0):
+    """OrderFlow.convert and query at random timestamps"""
+    flow = OrderFlow()
+    flow.df = df.copy()
+    start = time.perf_counter()
+    flow.convert()
+    convert = time.perf_counter() - start
+    rng = np.random.RandomState(seed)
+    times = pd.to_datetime(rng.randint(df['ExchTime'].iloc[0].value, df['ExchTime'].iloc[-1].value, queries))
+    start = time.perf_counter()
+    for timestamp in times:
+        flow.query(timestamp)
+    return {'convert_messages_per_sec': len(df) / convert, 'queries_per_sec': queries / (time.perf_counter() - start)}
+
+# module imported by fresh interpreters -> name of its results
+STARTUP = {
+    'TradingGym': 'package',
+    'TradingGym.Replay': 'core',
+    'TradingGym.envs': 'envs',
+    'TradingGym.envs.trading_env': 'trading_env',
+}
+HEAVY = ('gym', 'pandas', 'tqdm', 'numba', 'tables', 'matplotlib')
+
+_IMPORT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {heavy!r} if name in sys.modules]]))
+'''
+
+def benchStartup(repeat=5):
+    """
+    Import time and whole spawn time (best of repeat) of STARTUP modules in fresh
+    interpreters, like process pool workers pay them, and heavy modules they load
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    ret = {}
+    for module, name in STARTUP.items():
+        code = _IMPORT.format(module=module, heavy=HEAVY)
+        imports, spawns = [], []
+        for i in range(repeat):
+            start = time.perf_counter()
+            out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+            spawns.append(time.perf_counter() - start)
+            seconds, heavy = json.loads(out.stdout.splitlines()[-1])
+            imports.append(seconds)
+        ret[name + '_import_seconds'] = min(imports)
+        ret[name + '_spawn_seconds'] = min(spawns)
+        ret[name + '_heavy_modules'] = len(heavy)
+    return ret
+
+def run(messages=10**5, levels=20, seed=0, steps=2000):
+    """Dict of machine, parameters and results of all benchmarks"""
+    start = time.perf_counter()
+    df = syntheticFlow(messages, levels, seed)
+    generate = time.perf_counter() - start
+    tape = Tape.fromFrame(df)
+    results = {'synthetic': {'seconds': generate}}
+    results['startup'] = benchStartup()
+    results['order_book'] = benchOrderBook(df, tape)
+    results['backtester_strategy'] = benchBacktester(tape, Strategy())
+    results['backtester_spread'] = benchBacktester(tape, SpreadStrategy())
+    path = tempfile.mkdtemp()
+    try:
+        hdf_path = os.path.join(path, 'synthetic.h5')
+        df.to_hdf(hdf_path, key='/synthetic')
+        results['trading_env'] = benchEnv(hdf_path, '/synthetic', os.path.join(path, 'cache'), steps, seed)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    results['order_flow'] = benchOrderFlow(df, seed=seed)
+    results['process'] = {'peak_rss_mb': _rssMb()}
+    return {
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor()},
+        'params': {'messages': messages, 'levels': levels, 'seed': seed, 'steps': steps},
+        'results': results,
+    }
+
+def compare(report, baseline, tolerance=0.25):
+    """
+    List of regressions of report against baseline: throughput (per_sec) lower or
+    memory (rss, blocks, bytes) and startup time higher by more than tolerance,
+    or more heavy modules loaded on startup
+    """
+    regressions = []
+    for name, metrics in baseline['results'].items():
+        for metric, old in metrics.items():
+            new = report['results'].get(name, {}).get(metric)
+            if new is None:
+                continue
+            if metric.endswith('_per_sec') and new < old * (1 - tolerance):
+                regressions.append('{}.{}: {:.4g} < {:.4g}'.format(name, metric, new, old))
+            elif metric.startswith(('peak_', 'retained_')) and new > max(old, 1) * (1 + tolerance):
+                regressions.append('{}.{}: {:.4g} > {:.4g}'.format(name, metric, new, old))
+            elif metric.endswith(('_import_seconds', '_spawn_seconds')) and new > max(old, 0.01) * (1 + tolerance):
+                regressions.append('{}.{}: {:.4g} > {:.4g}'.format(name, metric, new, old))
+            elif metric.endswith('_heavy_modules') and new > old:
+                regressions.append('{}.{}: {} > {}'.format(name, metric, new, old))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TradingGym replay benchmarks on synthetic sessions')
+    parser.add_argument('--messages', type=int, default=10**5)
+    parser.add_argument('--levels', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--output', help='write results json here')
+    parser.add_argument('--baseline', help='compare with results json from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = run(args.messages, args.levels, args.seed, args.steps)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['params'] != report['params']:
+            # per message and per step results depend on the session size, nothing to compare
+            print('Baseline has different params: {}, not compared'.format(baseline['params']))
+            return 2
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
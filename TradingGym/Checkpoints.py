@@ -0,0 +1,82 @@
+from TradingGym.OrderBook import OrderBook
+import numpy as np
+import json
+import os
+
+
+class Checkpoints:
+    """
+    Implements order book snapshots taken along a Tape to start replay anywhere
+    """
+    ARRAYS = ['positions', 'offsets', 'bid_counts', 'prices', 'amounts']
+
+    def __init__(self, positions, offsets, bid_counts, prices, amounts, every=None, seconds=None):
+        self.positions = positions # book at checkpoint i has messages [0, positions[i]) applied
+        self.offsets = offsets # levels of checkpoint i are [offsets[i], offsets[i+1]), bids first
+        self.bid_counts = bid_counts
+        self.prices = prices
+        self.amounts = amounts
+        self.every = every
+        self.seconds = seconds
+
+    @classmethod
+    def build(cls, tape, every=10**5, seconds=None):
+        """Replay tape once taking snapshot every N messages and/or every T seconds"""
+        positions = np.arange(0, len(tape), every if every else len(tape) + 1, dtype=np.int64)
+        if seconds:
+            times = np.arange(tape.ts[0], tape.ts[-1], int(seconds * 10**9), dtype=np.int64)
+            positions = np.union1d(positions, np.searchsorted(tape.ts, times))
+        book = OrderBook()
+        offsets = [0]
+        bid_counts = []
+        prices = []
+        amounts = []
+        used_idx = 0
+        for position in positions.tolist():
+            book.updateRange(tape, used_idx, position)
+            used_idx = position
+            for side in range(2):
+                for price, amount in book.levels(side):
+                    prices.append(price)
+                    amounts.append(amount)
+                if side == 0:
+                    bid_counts.append(len(prices) - offsets[-1])
+            offsets.append(len(prices))
+        return cls(positions, np.array(offsets, dtype=np.int64), np.array(bid_counts, dtype=np.int64),
+            np.array(prices, dtype=np.int64), np.array(amounts, dtype=np.int64), every, seconds)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'checkpoints.json'), 'w') as f:
+            json.dump({'every': self.every, 'seconds': self.seconds}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'checkpoints.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(every=meta['every'], seconds=meta['seconds'], **arrays)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest(self, position):
+        """Index of the last checkpoint at or before position"""
+        return max(int(np.searchsorted(self.positions, position, side='right')) - 1, 0)
+
+    def restore(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        middle = start + int(self.bid_counts[i])
+        book = OrderBook()
+        book.book = (dict(zip(self.prices[start:middle].tolist(), self.amounts[start:middle].tolist())),
+            dict(zip(self.prices[middle:end].tolist(), self.amounts[middle:end].tolist())))
+        return book
+
+    def seek(self, tape, position):
+        """Book with messages [0, position) of tape applied, replaying only from the nearest checkpoint"""
+        i = self.nearest(position)
+        book = self.restore(i)
+        book.updateRange(tape, int(self.positions[i]), position)
+        return book
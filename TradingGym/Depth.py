@@ -0,0 +1,95 @@
+class Depth:
+    """
+    Implements cumulative amount and notional of book side levels over price ticks (Fenwick trees),
+    indexes go from the best price to the worst
+    """
+    def __init__(self, reverse, levels=(), size=1024):
+        self.reverse = reverse # True for bids where the best price is the highest
+        self.__origin = None # key of index 1
+        self.__size = size
+        self.__points = [0] * (size + 1) # amount of every index
+        self.__amounts = [0] * (size + 1)
+        self.__notionals = [0] * (size + 1)
+        for price, amount in levels:
+            self.add(price, amount)
+
+    def __key(self, price):
+        return -price if self.reverse else price
+
+    def __resize(self, key):
+        # keep the filled range in the middle of a power of two sized grid
+        points = self.__points
+        lo = min(self.__origin, key)
+        hi = max(self.__origin + self.__size - 1, key)
+        size = self.__size
+        while size < 2 * (hi - lo + 1):
+            size *= 2
+        origin = lo - (size - (hi - lo + 1)) // 2
+        shift = self.__origin - origin
+        self.__points = [0] * (size + 1)
+        self.__points[1 + shift:1 + shift + self.__size] = points[1:]
+        self.__origin = origin
+        self.__size = size
+        self.__build()
+
+    def __build(self):
+        # O(size) construction from points
+        amounts = self.__amounts = list(self.__points)
+        notionals = self.__notionals = [0] * (self.__size + 1)
+        sign = -1 if self.reverse else 1
+        for i in range(1, self.__size + 1):
+            notionals[i] += sign * (self.__origin + i - 1) * self.__points[i]
+            parent = i + (i & -i)
+            if parent <= self.__size:
+                amounts[parent] += amounts[i]
+                notionals[parent] += notionals[i]
+
+    def add(self, price, amount):
+        """Add amount (negative to remove) at price"""
+        key = self.__key(price)
+        if self.__origin is None:
+            self.__origin = key - self.__size // 2
+        i = key - self.__origin + 1
+        if i < 1 or i > self.__size:
+            self.__resize(key)
+            i = key - self.__origin + 1
+        self.__points[i] += amount
+        notional = price * amount
+        amounts = self.__amounts
+        notionals = self.__notionals
+        size = self.__size
+        while i <= size:
+            amounts[i] += amount
+            notionals[i] += notional
+            i += i & -i
+
+    def total(self):
+        """Amount of all levels"""
+        ret = 0
+        i = self.__size
+        while i > 0:
+            ret += self.__amounts[i]
+            i -= i & -i
+        return ret
+
+    def notional(self, amount):
+        """Notional of the best amount, all levels if there is less"""
+        if amount <= 0:
+            return 0
+        amounts = self.__amounts
+        notionals = self.__notionals
+        # largest index with cumulative amount below the requested one
+        i = 0
+        ret = 0
+        step = 1 << (self.__size.bit_length() - 1)
+        while step:
+            j = i + step
+            if j <= self.__size and amounts[j] < amount:
+                i = j
+                amount -= amounts[j]
+                ret += notionals[j]
+            step >>= 1
+        if i < self.__size:
+            key = self.__origin + i
+            ret += (-key if self.reverse else key) * amount
+        return ret
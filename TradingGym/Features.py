@@ -0,0 +1,194 @@
+from TradingGym.Replay import Replay
+import numpy as np
+import json
+import os
+
+
+class Feature:
+    """
+    Implements base observation feature: size values updated once per step
+    """
+    size = 1
+
+    def reset(self):
+        """Forget the state of previous steps"""
+        pass
+
+    def update(self, book, tape, start, end, out):
+        """Write values for book after messages [start, end) of tape into out"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{}()'.format(self.__class__.__name__)
+
+
+class TopLevels(Feature):
+    """
+    Implements amounts of n best bids and then n best asks, zero padded
+    """
+    def __init__(self, n=5):
+        self.n = n
+        self.size = 2 * n
+
+    def update(self, book, tape, start, end, out):
+        out[:] = 0.0
+        for side in range(2):
+            j = side * self.n
+            for price, amount in book.levels(side):
+                if j == (side + 1) * self.n:
+                    break
+                out[j] = amount
+                j += 1
+
+    def __repr__(self):
+        return 'TopLevels({})'.format(self.n)
+
+
+class Spread(Feature):
+    """
+    Implements best ask minus best bid, nan if a side is empty
+    """
+    def update(self, book, tape, start, end, out):
+        out[0] = book.bestAsk()[0] - book.bestBid()[0]
+
+
+class Microprice(Feature):
+    """
+    Implements best prices weighted by amount of the opposite side, minus mid price
+    """
+    def update(self, book, tape, start, end, out):
+        bid, bid_amount = book.bestBid()
+        ask, ask_amount = book.bestAsk()
+        out[0] = (bid * ask_amount + ask * bid_amount) / (bid_amount + ask_amount) - (bid + ask) / 2
+
+
+class OrderFlowImbalance(Feature):
+    """
+    Implements order flow imbalance of best levels between two steps (Cont, Kukanov, Stoikov)
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.previous = None # best bid, its amount, best ask, its amount of the previous step
+
+    def update(self, book, tape, start, end, out):
+        bid, bid_amount = book.bestBid()
+        ask, ask_amount = book.bestAsk()
+        if self.previous is None:
+            out[0] = 0.0
+        else:
+            old_bid, old_bid_amount, old_ask, old_ask_amount = self.previous
+            out[0] = ((bid_amount if bid >= old_bid else 0) - (old_bid_amount if bid <= old_bid else 0)
+                - (ask_amount if ask <= old_ask else 0) + (old_ask_amount if ask >= old_ask else 0))
+        self.previous = (bid, bid_amount, ask, ask_amount)
+
+
+class TradeVolume(Feature):
+    """
+    Implements traded volume of the last steps
+    """
+    def __init__(self, steps=10):
+        self.steps = steps
+        self.__tape = None
+        self.reset()
+
+    def reset(self):
+        self.volumes = np.zeros(self.steps, dtype=np.int64) # ring of volumes per step
+        self.step = 0
+        self.total = 0
+
+    def __cumulative(self, tape):
+        # volume traded by messages [0, i), deal at d is the message d-1
+        if self.__tape is not tape:
+            volumes = np.zeros(len(tape) + 1, dtype=np.int64)
+            deals = tape.deals()
+            volumes[deals] = tape.amount[deals - 1]
+            self.__cum = np.cumsum(volumes)
+            self.__tape = tape
+        return self.__cum
+
+    def update(self, book, tape, start, end, out):
+        cum = self.__cumulative(tape)
+        volume = int(cum[end] - cum[start])
+        i = self.step % self.steps
+        self.total += volume - int(self.volumes[i])
+        self.volumes[i] = volume
+        self.step += 1
+        out[0] = self.total
+
+    def __repr__(self):
+        return 'TradeVolume({})'.format(self.steps)
+
+
+class FeaturePipeline:
+    """
+    Implements list of features written into one preallocated float32 vector every step
+    """
+    def __init__(self, features):
+        self.features = list(features)
+        self.size = sum(feature.size for feature in self.features)
+        self.values = np.zeros(self.size, dtype=np.float32)
+        self.__outs = []
+        offset = 0
+        for feature in self.features:
+            self.__outs.append(self.values[offset:offset + feature.size])
+            offset += feature.size
+
+    def reset(self):
+        for feature in self.features:
+            feature.reset()
+
+    def update(self, book, tape, start, end):
+        """Values for book after messages [start, end) of tape, the same array every call"""
+        for feature, out in zip(self.features, self.__outs):
+            feature.update(book, tape, start, end, out)
+        return self.values
+
+    def precompute(self, tape, sleep=100, max_length=10**7):
+        """FeatureTable of the session replayed in steps of sleep ms from trading start"""
+        self.reset()
+        replay = Replay(tape, max_length)
+        start_time = replay.strategy_time
+        values = np.zeros((replay.total_time // (sleep * 1000000) + 2, self.size), dtype=np.float32)
+        values[0] = self.update(replay.book, tape, replay.idx, replay.idx)
+        k = 1
+        while not replay.exhausted(sleep) and k < len(values):
+            start = replay.idx
+            for deal in replay.advance(sleep):
+                pass
+            values[k] = self.update(replay.book, tape, start, replay.idx)
+            k += 1
+        self.reset()
+        return FeatureTable(values[:k], start_time, sleep, repr(self))
+
+    def __repr__(self):
+        return 'FeaturePipeline({})'.format(self.features)
+
+
+class FeatureTable:
+    """
+    Implements features precomputed at strategy times start_time + k * sleep ms
+    """
+    def __init__(self, values, start_time, sleep, pipeline):
+        self.values = values
+        self.start_time = start_time
+        self.sleep = sleep
+        self.pipeline = pipeline # repr of FeaturePipeline which has computed values
+
+    def at(self, time):
+        """Row of the last step at or before time (int nanoseconds)"""
+        k = (time - self.start_time) // (self.sleep * 1000000)
+        return self.values[min(max(k, 0), len(self.values) - 1)]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'values.npy'), self.values)
+        with open(os.path.join(path, 'features.json'), 'w') as f:
+            json.dump({'start_time': self.start_time, 'sleep': self.sleep, 'pipeline': self.pipeline}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'features.json')) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode), **meta)
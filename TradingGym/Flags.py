@@ -0,0 +1,65 @@
+import numpy as np
+
+# bits of the decoded Flags column
+ADD = 1
+BUY = 2
+SNAPSHOT = 4
+END_OF_TRANSACTION = 8
+SELL = 16
+FILL = 32
+QUOTE = 64
+COUNTER = 128
+NON_SYSTEM = 256
+FILL_OR_KILL = 512
+MOVED = 1024
+CANCELED = 2048
+CANCELED_GROUP = 4096
+CROSS_TRADE = 8192
+FLOW_START = 16384
+NON_ZERO_REPL_ACT = 32768
+
+FLAG_BITS = {
+    'Add': ADD,
+    'Buy': BUY,
+    'Snapshot': SNAPSHOT,
+    'EndOfTransaction': END_OF_TRANSACTION,
+    'Sell': SELL,
+    'Fill': FILL,
+    'Quote': QUOTE,
+    'Counter': COUNTER,
+    'NonSystem': NON_SYSTEM,
+    'FillOrKill': FILL_OR_KILL,
+    'Moved': MOVED,
+    'Canceled': CANCELED,
+    'CanceledGroup': CANCELED_GROUP,
+    'CrossTrade': CROSS_TRADE,
+    'FlowStart': FLOW_START,
+    'NonZeroReplAct': NON_ZERO_REPL_ACT,
+}
+
+def parseFlags(flags):
+    """
+    Decode Flags strings like 'Add, Buy, Snapshot' into bitmasks
+    """
+    import pandas as pd # only parsing hdf frames needs it
+    codes, uniques = pd.factorize(pd.Series(flags), sort=False)
+    # the extra trailing zero is picked by missing values (code -1)
+    masks = np.zeros(len(uniques) + 1, dtype=np.uint32)
+    for i, value in enumerate(uniques):
+        for name in value.replace(';', ',').split(','):
+            masks[i] |= FLAG_BITS.get(name.strip(), 0)
+    return masks[codes]
+
+def formatFlags(mask):
+    """
+    Encode bitmask back to Flags string
+    """
+    return ', '.join(name for name, bit in FLAG_BITS.items() if mask & bit)
+
+def decodeFlags(df):
+    """
+    Replace string Flags column of data frame with bitmasks inplace
+    """
+    if df is not None and 'Flags' in df and df['Flags'].dtype.kind not in 'iu':
+        df['Flags'] = parseFlags(df['Flags'].values)
+    return df
@@ -0,0 +1,51 @@
+from TradingGym.Tape import Tape
+from pandas import Timedelta, Timestamp
+import pandas as pd
+import numpy as np
+
+
+class History:
+    """
+    Implements read-only cursor over messages [0, end) of a Tape handed to strategies
+    """
+    def __init__(self, tape, end=0):
+        self.tape = tape
+        self.end = end # moved forward by Backtester, no data is copied
+
+    def __len__(self):
+        return self.end
+
+    def __getattr__(self, name):
+        # columns of Tape cut at the cursor, e.g. history.price
+        if name in Tape.COLUMNS:
+            return getattr(self.tape, name)[:self.end]
+        raise AttributeError(name)
+
+    def time(self):
+        """Timestamp of the last seen message"""
+        return Timestamp(self.tape.ts[self.end - 1])
+
+    def last(self, n):
+        """Tape of the last n messages"""
+        return self.tape.slice(max(self.end - n, 0), self.end)
+
+    def window(self, duration):
+        """Tape of messages within duration (Timedelta or string like '5s') before the last one"""
+        start_time = self.tape.ts[self.end - 1] - Timedelta(duration).value
+        return self.between(start_time)
+
+    def between(self, start_time, end_time=None):
+        """Tape of seen messages with start_time <= ExchTime < end_time"""
+        ts = self.tape.ts[:self.end]
+        start = np.searchsorted(ts, Timestamp(start_time).value)
+        end = self.end if end_time is None else np.searchsorted(ts, Timestamp(end_time).value)
+        return self.tape.slice(start, end)
+
+    def frame(self, n=None):
+        """Data frame of the last n (all by default) messages, this one copies"""
+        tape = self.last(self.end if n is None else n)
+        return pd.DataFrame({
+            'ExchTime': pd.to_datetime(tape.ts), 'OrderId': tape.order_id, 'Price': tape.price,
+            'Amount': tape.amount, 'AmountRest': tape.amount_rest, 'DealId': tape.deal_id,
+            'DealPrice': tape.deal_price, 'OI': tape.oi, 'Flags': tape.flags},
+            index=pd.RangeIndex(self.end - len(tape), self.end))
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+class IntervalTree:
+    """
+    Implements centered interval tree over open intervals (starts[i], ends[i]),
+    stab(t) returns positions i of intervals containing t in O(log^2 n + k), stabMany
+    of T times sweeps sorted endpoints once in O((n + T) log n + k log k) for k found
+    """
+    LEAF = 64 # intervals below which a node is scanned instead of split
+
+    def __init__(self, starts, ends):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        positions = np.flatnonzero(starts < ends) # empty intervals contain nothing
+        # endpoints in order for the sweep of stabMany
+        self.__starts = starts[positions]
+        self.__ends = ends[positions]
+        self.__positions = positions
+        self.__start_order = np.argsort(self.__starts, kind='stable')
+        self.__end_order = np.argsort(self.__ends, kind='stable')
+        # nodes as parallel lists, children are node numbers or -1
+        self.centers = []
+        self.leaves = []
+        self.lefts = []
+        self.rights = []
+        self.by_start = [] # (sorted starts, their ends, positions)
+        self.by_end = [] # (sorted ends, positions)
+        if len(positions):
+            self.__build(starts, ends, positions)
+
+    def __len__(self):
+        return len(self.centers)
+
+    def __build(self, starts, ends, positions):
+        node = len(self.centers)
+        self.centers.append(0)
+        self.leaves.append(True)
+        self.lefts.append(-1)
+        self.rights.append(-1)
+        self.by_start.append(None)
+        self.by_end.append(None)
+
+        s = starts[positions]
+        e = ends[positions]
+        here = np.ones(len(positions), dtype=bool)
+        if len(positions) > self.LEAF:
+            center = int(np.median(np.concatenate([s, e])))
+            here = (s <= center) & (center <= e)
+            left = e < center
+            right = s > center
+            if left.any():
+                self.lefts[node] = self.__build(starts, ends, positions[left])
+            if right.any():
+                self.rights[node] = self.__build(starts, ends, positions[right])
+            self.centers[node] = center
+            self.leaves[node] = False
+        s, e, positions = s[here], e[here], positions[here]
+        order = np.argsort(s, kind='stable')
+        self.by_start[node] = (s[order], e[order], positions[order])
+        order = np.argsort(e, kind='stable')
+        self.by_end[node] = (e[order], positions[order])
+        return node
+
+    def stab(self, t):
+        """Sorted positions of intervals with start < t < end"""
+        found = []
+        node = 0 if self.centers else -1
+        while node != -1:
+            center = self.centers[node]
+            starts, ends, positions = self.by_start[node]
+            if self.leaves[node] or t == center:
+                found.append(positions[(starts < t) & (ends > t)])
+                break
+            if t < center:
+                # all intervals here end at or after center > t
+                found.append(positions[:np.searchsorted(starts, t, side='left')])
+                node = self.lefts[node]
+            else:
+                # all intervals here start at or before center < t
+                ends, positions = self.by_end[node]
+                found.append(positions[np.searchsorted(ends, t, side='right'):])
+                node = self.rights[node]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+    def stabMany(self, times):
+        """List of stab(t) for every t of times in one sweep over times sorted"""
+        times = np.asarray(times, dtype=np.int64)
+        order = np.argsort(times, kind='stable')
+        sorted_times = times[order]
+        # intervals started before t, then the ones which ended at or before t
+        started = np.searchsorted(self.__starts[self.__start_order], sorted_times, side='left').tolist()
+        ended = np.searchsorted(self.__ends[self.__end_order], sorted_times, side='right').tolist()
+        adds = self.__positions[self.__start_order].tolist()
+        removes = self.__positions[self.__end_order].tolist()
+        found = [None] * len(times)
+        active = set()
+        i = j = 0
+        for k, a, b in zip(order.tolist(), started, ended):
+            active.update(adds[i:a])
+            active.difference_update(removes[j:b])
+            i, j = a, b
+            found[k] = np.array(sorted(active), dtype=np.int64)
+        return found
@@ -0,0 +1,243 @@
+from TradingGym.SessionCache import _publish
+from TradingGym.Replay import _nanos
+import numpy as np
+import hashlib
+import shutil
+import json
+import os
+
+
+class CachedBook:
+    """
+    Implements read-only order book of depth best levels per side recorded by MarketPath,
+    asking for a level beyond them raises if the market book had more
+    """
+    def __init__(self, bids, asks, counts):
+        self.__sides = (bids, asks) # (prices, amounts) lists
+        self.__counts = counts # levels per side of the market book
+
+    def __check(self, side, n):
+        if n > len(self.__sides[side][0]) and self.__counts[side] > len(self.__sides[side][0]):
+            raise RuntimeError('Market path has only {} levels, build it with larger depth'.format(len(self.__sides[side][0])))
+
+    def __best(self, side):
+        prices, amounts = self.__sides[side]
+        if not prices:
+            return (float('nan'), float('nan'))
+        return (prices[0], amounts[0])
+
+    def bestBid(self):
+        return self.__best(0)
+
+    def bestAsk(self):
+        return self.__best(1)
+
+    def midPrice(self):
+        if not self.__sides[0][0] or not self.__sides[1][0]:
+            return float('nan')
+        return (self.__sides[0][0][0] + self.__sides[1][0][0]) / 2
+
+    def levels(self, side):
+        """Iterate (price, amount) of bids (0) or asks (1) from the best price"""
+        prices, amounts = self.__sides[side]
+        for i in range(len(prices)):
+            yield prices[i], amounts[i]
+        self.__check(side, len(prices) + 1)
+
+    def top(self, side, n):
+        """Prices and amounts of n best bids (0) or asks (1)"""
+        self.__check(side, n)
+        prices, amounts = self.__sides[side]
+        return prices[:n], amounts[:n]
+
+    def liquidation(self, side, amount):
+        """Notional of the best amount of bids (0) or asks (1), same as OrderBook.liquidation"""
+        if amount <= 0:
+            return 0
+        ret = 0
+        for price, value in self.levels(side):
+            if value >= amount:
+                return ret + price * amount
+            amount -= value
+            ret += price * value
+        return ret
+
+
+class MarketPath:
+    """
+    Implements market side of an episode recorded once: book levels at the start of every
+    step and before every deal, under no market impact it is the same for any trader
+    """
+    ARRAYS = ['step_first', 'idx', 'offsets', 'counts', 'prices', 'amounts']
+
+    def __init__(self, step_first, idx, offsets, counts, prices, amounts, start_time, trading_start, trading_end, end_time, sleep):
+        self.step_first = step_first # snapshots of step k are [step_first[k], step_first[k+1]), deals after the first
+        self.idx = idx # messages applied to the book of a snapshot, deal position for deals
+        self.offsets = offsets # levels of snapshot i and side s are [offsets[2i+s], offsets[2i+s+1])
+        self.counts = counts # levels of the market book per snapshot and side
+        self.prices = prices
+        self.amounts = amounts
+        self.start_time = start_time
+        self.trading_start = trading_start # positions of Replay
+        self.trading_end = trading_end
+        self.end_time = end_time # time of the last message of trading
+        self.sleep = sleep
+
+    def __len__(self):
+        """Recorded steps"""
+        return len(self.step_first) - 1
+
+    @classmethod
+    def build(cls, replay, sleep, steps, depth=32):
+        """Record up to steps steps of sleep ms advancing replay"""
+        step_first = [0]
+        idx = []
+        offsets = [0]
+        counts = []
+        prices = []
+        amounts = []
+
+        def snapshot():
+            idx.append(replay.idx)
+            for side in range(2):
+                side_prices, side_amounts = replay.book.top(side, depth)
+                prices.extend(side_prices)
+                amounts.extend(side_amounts)
+                offsets.append(len(prices))
+                counts.append(len(replay.book.book[side]))
+
+        start_time = replay.strategy_time
+        snapshot()
+        for step in range(steps):
+            if replay.exhausted(sleep):
+                break
+            for deal in replay.advance(sleep):
+                snapshot()
+            step_first.append(len(idx))
+            snapshot()
+        return cls(np.array(step_first, dtype=np.int64), np.array(idx, dtype=np.int64),
+            np.array(offsets, dtype=np.int64), np.array(counts, dtype=np.int64).reshape(-1, 2),
+            np.array(prices, dtype=np.int64), np.array(amounts, dtype=np.int64),
+            start_time, replay.trading_start, replay.trading_end, int(replay.tape.ts[replay.trading_end]), sleep)
+
+    def book(self, i):
+        """CachedBook of snapshot i"""
+        sides = []
+        for side in range(2):
+            start, end = int(self.offsets[2 * i + side]), int(self.offsets[2 * i + side + 1])
+            sides.append((self.prices[start:end].tolist(), self.amounts[start:end].tolist()))
+        return CachedBook(sides[0], sides[1], self.counts[i].tolist())
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'path.json'), 'w') as f:
+            json.dump({'start_time': self.start_time, 'trading_start': self.trading_start,
+                'trading_end': self.trading_end, 'end_time': self.end_time, 'sleep': self.sleep}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'path.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(**arrays, **meta)
+
+
+class CachedReplay:
+    """
+    Implements Replay over MarketPath: the same book, time and deals for recorded steps
+    without replaying messages
+    """
+    def __init__(self, tape, path):
+        self.tape = tape
+        self.path = path
+        self.step = 0
+        self.strategy_time = path.start_time
+        self.trading_start = path.trading_start
+        self.trading_end = path.trading_end
+        self.__snapshot(0)
+
+    def __snapshot(self, i):
+        self.idx = int(self.path.idx[i])
+        self.book = self.path.book(i)
+
+    def finished(self):
+        """True if recorded steps are used up"""
+        return self.step >= len(self.path)
+
+    def advance(self, sleep):
+        """Same as Replay.advance for recorded steps of the same sleep"""
+        if sleep != self.path.sleep or self.finished():
+            raise RuntimeError('Market path has no step of {} ms'.format(sleep))
+        self.strategy_time += sleep * 1000000
+        first, last = int(self.path.step_first[self.step]), int(self.path.step_first[self.step + 1])
+        for i in range(first + 1, last):
+            self.__snapshot(i)
+            yield self.idx
+        self.step += 1
+        self.__snapshot(last)
+
+    def exhausted(self, sleep):
+        """True if the next step of sleep ms would pass the end of trading"""
+        return self.strategy_time + sleep * 1000000 >= self.path.end_time
+
+
+class MarketCache:
+    """
+    Implements directory of MarketPath per (session, sleep, start, steps, depth) evicting
+    the least recently used ones above max_bytes
+    """
+    def __init__(self, cache_dir, max_bytes=2**30, depth=32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.depth = depth
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def pathOf(self, key):
+        """Directory of MarketPath for key tuple"""
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest()[:20])
+
+    def get(self, key, build):
+        """MarketPath of key, build() records it if it is not cached"""
+        path = self.pathOf(key)
+        marker = os.path.join(path, 'path.json')
+        if os.path.exists(marker):
+            os.utime(marker) # used now
+            return MarketPath.load(path)
+        market_path = build()
+        tmp_path = '{}.tmp{}'.format(path, os.getpid())
+        market_path.save(tmp_path)
+        _publish(tmp_path, path)
+        self.evict(keep=path)
+        return market_path
+
+    def evict(self, keep=None):
+        """Remove the least recently used paths until the cache fits max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            marker = os.path.join(path, 'path.json')
+            if not os.path.exists(marker):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+            entries.append((os.path.getmtime(marker), path, size))
+        total = sum(size for used, path, size in entries)
+        for used, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def replay(self, env, start):
+        """CachedReplay of env episode from start, recorded by seeking env if it is not cached"""
+        key = (env.hdf_path, env.key, len(env.tape), env.max_length, env.sleep, _nanos(start), env.EPISODE, self.depth)
+
+        def build():
+            env.seek(start)
+            return MarketPath.build(env.replay, env.sleep, env.EPISODE, self.depth)
+        return CachedReplay(env.tape, self.get(key, build))
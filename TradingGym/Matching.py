@@ -0,0 +1,196 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+NAN = float('nan')
+LEVELS = 16 # market levels fetched at first, doubled while a kernel asks for more
+
+
+def matchDealKernel(prices, amounts, i, trader_prices, trader_volumes, first,
+        buySell, deal_amount, deal_price, strong, position, r_pnl):
+    """
+    Match deal with trader's levels [first, ...) of the side it hits, going through market
+    levels [i, ...) of that side, returns (i, first, deal_amount, position, r_pnl, finished),
+    not finished means that more market levels are needed
+    """
+    sign = -1.0 if buySell else 1.0
+    n = len(trader_prices)
+    while i < len(prices):
+        price = prices[i]
+        if first < n:
+            best = trader_prices[first]
+            volume = trader_volumes[first]
+        else:
+            best = NAN
+            volume = NAN
+        if buySell:
+            stop = best > deal_price and price > deal_price
+            ahead = best < price
+        else:
+            stop = best < deal_price and price < deal_price
+            ahead = best > price
+        if stop:
+            return i, first, deal_amount, position, r_pnl, True
+        if ahead or (best == price and strong):
+            if volume >= deal_amount:
+                # level stays even if nothing is left of it
+                trader_volumes[first] -= deal_amount
+                position += sign * deal_amount
+                r_pnl -= sign * deal_amount * best
+                deal_amount = 0
+            else:
+                first += 1
+                position += sign * volume
+                r_pnl -= sign * volume * best
+                deal_amount -= volume
+        else:
+            deal_amount -= amounts[i]
+        if deal_amount <= 0:
+            return i, first, deal_amount, position, r_pnl, True
+        i += 1
+    return i, first, deal_amount, position, r_pnl, False
+
+
+def crossBookKernel(prices, amounts, i, trader_prices, trader_volumes, first, side, position):
+    """
+    Fill trader's levels [first, ...) of side crossing market levels [i, ...) of the other side,
+    returns (i, first, position, finished)
+    """
+    sign = 1.0 if side == 0 else -1.0
+    n = len(trader_prices)
+    while i < len(prices):
+        price = prices[i]
+        value = amounts[i]
+        if first >= n:
+            return i, first, position, True
+        best = trader_prices[first]
+        volume = trader_volumes[first]
+        if (best < price if side == 0 else best > price) or best != best:
+            return i, first, position, True
+        if volume > value:
+            trader_volumes[first] -= value
+            position += sign * value
+        else:
+            position += sign * volume
+            first += 1
+        i += 1
+    return i, first, position, False
+
+
+if njit is not None:
+    matchDealJit = njit(cache=True)(matchDealKernel)
+    crossBookJit = njit(cache=True)(crossBookKernel)
+else:
+    matchDealJit = None
+    crossBookJit = None
+
+useJit = njit is not None # set False to run the pure Python kernels
+
+
+def _traderSide(levels):
+    # trader's levels best first as kernel arguments, their keys and volumes as given
+    keys, volumes = levels.top(len(levels))
+    if useJit:
+        return keys, volumes, np.array(keys, dtype=np.float64), np.array(volumes, dtype=np.float64)
+    return keys, volumes, keys, list(volumes)
+
+
+def _marketSide(book, side, n):
+    prices, amounts = book.top(side, n)
+    if useJit:
+        return np.array(prices, dtype=np.float64), np.array(amounts, dtype=np.float64)
+    return prices, amounts
+
+
+def _commit(levels, keys, volumes, trader_volumes, first):
+    # removed levels are deleted, the next one gets its volume if it has changed
+    for key in keys[:first]:
+        del levels[key]
+    if first < len(keys) and trader_volumes[first] != volumes[first]:
+        levels[keys[first]] = trader_volumes[first]
+
+
+def matchLevels(book, trader_prices, trader_volumes, first, buySell, deal_amount, deal_price, position, r_pnl, strong=False):
+    """
+    Run matchDealKernel over market levels fetched from book in growing batches,
+    trader's volumes are changed in place, returns (first, position, r_pnl)
+    """
+    if useJit:
+        kernel = matchDealJit
+        deal_amount, deal_price = float(deal_amount), float(deal_price)
+    else:
+        kernel = matchDealKernel
+    side = 1 if buySell else 0
+    i, n = 0, LEVELS
+    while True:
+        prices, amounts = _marketSide(book, side, n)
+        i, first, deal_amount, position, r_pnl, finished = kernel(prices, amounts, i,
+            trader_prices, trader_volumes, first, buySell, deal_amount, deal_price, strong, position, r_pnl)
+        if finished or len(prices) < n:
+            return first, position, r_pnl
+        n *= 2
+
+
+def crossLevels(book, side, trader_prices, trader_volumes, first, position):
+    """
+    Run crossBookKernel for trader's side over market levels of the other side,
+    trader's volumes are changed in place, returns (first, position)
+    """
+    kernel = crossBookJit if useJit else crossBookKernel
+    i, n = 0, LEVELS
+    while True:
+        prices, amounts = _marketSide(book, 1 - side, n)
+        i, first, position, finished = kernel(prices, amounts, i, trader_prices, trader_volumes, first, side, position)
+        if finished or len(prices) < n:
+            return first, position
+        n *= 2
+
+
+def matchDeal(book, new_book, buySell, deal_amount, deal_price, position, r_pnl, strong=False):
+    """
+    Match deal message (its aggressor side, amount and price) with trader's new_book
+    behind market book, returns new position and realized PnL
+    """
+    levels = new_book.book[1 if buySell else 0]
+    keys, volumes, trader_prices, trader_volumes = _traderSide(levels)
+    first, position, r_pnl = matchLevels(book, trader_prices, trader_volumes, 0,
+        buySell, deal_amount, deal_price, position, r_pnl, strong)
+    _commit(levels, keys, volumes, trader_volumes, first)
+    return position, r_pnl
+
+
+def crossBook(book, new_book, position):
+    """
+    Fill trader's bids and then asks of new_book crossing market book, returns new position
+    """
+    for side in range(2):
+        levels = new_book.book[side]
+        keys, volumes, trader_prices, trader_volumes = _traderSide(levels)
+        first, position = crossLevels(book, side, trader_prices, trader_volumes, 0, position)
+        _commit(levels, keys, volumes, trader_volumes, first)
+    return position
+
+
+def matchArrayDeal(book, trader, buySell, deal_amount, deal_price, position, r_pnl, strong=False):
+    """
+    matchDeal for trader's ArrayBook, its slots are changed in place
+    """
+    side = 1 if buySell else 0
+    trader_prices, trader_volumes = trader.slots(side)
+    trader.first[side], position, r_pnl = matchLevels(book, trader_prices, trader_volumes, trader.first[side],
+        buySell, deal_amount, deal_price, position, r_pnl, strong)
+    return position, r_pnl
+
+
+def crossArrayBook(book, trader, position):
+    """
+    crossBook for trader's ArrayBook, its slots are changed in place
+    """
+    for side in range(2):
+        trader_prices, trader_volumes = trader.slots(side)
+        trader.first[side], position = crossLevels(book, side, trader_prices, trader_volumes, trader.first[side], position)
+    return position
+
@@ -1,41 +1,157 @@
+from TradingGym.Flags import ADD, BUY
+from TradingGym.Depth import Depth
+from bisect import bisect_left, insort
+
+class BookSide(dict):
+    """
+    Implements one side of order book as price -> amount dict with prices kept sorted
+    """
+    depth = None # Depth kept in sync once liquidation is asked
+
+    def __init__(self, reverse, levels=()):
+        super().__init__(levels)
+        self.reverse = reverse # True for bids where the best price is the highest
+        self.__prices = sorted(dict.keys(self))
+
+    def __reduce__(self):
+        return (self.__class__, (self.reverse, dict(self)))
+
+    def __setitem__(self, price, amount):
+        if not dict.__contains__(self, price):
+            insort(self.__prices, price)
+            if self.depth is not None:
+                self.depth.add(price, amount)
+        elif self.depth is not None:
+            self.depth.add(price, amount - dict.__getitem__(self, price))
+        dict.__setitem__(self, price, amount)
+
+    def __delitem__(self, price):
+        if self.depth is not None:
+            self.depth.add(price, -dict.__getitem__(self, price))
+        dict.__delitem__(self, price)
+        del self.__prices[bisect_left(self.__prices, price)]
+
+    def pop(self, price, *default):
+        if dict.__contains__(self, price):
+            del self.__prices[bisect_left(self.__prices, price)]
+            if self.depth is not None:
+                self.depth.add(price, -dict.__getitem__(self, price))
+        return dict.pop(self, price, *default)
+
+    def popitem(self):
+        price = self.best()
+        if price is None:
+            raise KeyError('popitem(): order book side is empty')
+        return (price, self.pop(price))
+
+    def setdefault(self, price, amount=None):
+        if not dict.__contains__(self, price):
+            self[price] = amount
+        return self[price]
+
+    def update(self, *args, **kwargs):
+        for price, amount in dict(*args, **kwargs).items():
+            self[price] = amount
+
+    def clear(self):
+        dict.clear(self)
+        self.__prices = []
+        if self.depth is not None:
+            self.depth = Depth(self.reverse)
+
+    def best(self):
+        if not self.__prices:
+            return None
+        return self.__prices[-1] if self.reverse else self.__prices[0]
+
+    def top(self, n):
+        """Lists of prices and amounts of n best levels"""
+        prices = self.__prices[:-n-1:-1] if self.reverse else self.__prices[:n]
+        return prices, [dict.__getitem__(self, price) for price in prices]
+
+    def levels(self):
+        """Iterate (price, amount) from the best price to the worst"""
+        prices = reversed(self.__prices) if self.reverse else iter(self.__prices)
+        for price in prices:
+            yield price, dict.__getitem__(self, price)
+
+    def liquidation(self, amount):
+        """Notional of the best amount (all levels if there is less), O(log ticks) once depth is tracked"""
+        if self.depth is None:
+            self.depth = Depth(self.reverse, dict.items(self))
+        return self.depth.notional(amount)
+
 class OrderBook:
     """
     Implements data structure to append messages one at a time
     """
     def __init__(self):
         # bids, asks
-        self.book = (dict(), dict())
-    
+        self.__book = (BookSide(True), BookSide(False))
+
+    @property
+    def book(self):
+        return self.__book
+
+    @book.setter
+    def book(self, book):
+        self.__book = (BookSide(True, book[0]), BookSide(False, book[1]))
+
     def bestBid(self):
-        if not self.book[0].keys():
+        price = self.__book[0].best()
+        if price is None:
             return (float('nan'), float('nan'))
-        price = max(self.book[0].keys())
-        return (price, self.book[0][price])
-    
+        return (price, self.__book[0][price])
+
     def bestAsk(self):
-        if not self.book[1].keys():
+        price = self.__book[1].best()
+        if price is None:
             return (float('nan'), float('nan'))
-        price = min(self.book[1].keys())
-        return (price, self.book[1][price])
-    
+        return (price, self.__book[1][price])
+
+    def midPrice(self):
+        bid = self.__book[0].best()
+        ask = self.__book[1].best()
+        if bid is None or ask is None:
+            return float('nan')
+        return (bid + ask) / 2
+
+    def levels(self, side):
+        """Iterate (price, amount) of bids (0) or asks (1) from the best price"""
+        return self.__book[side].levels()
+
+    def top(self, side, n):
+        """Prices and amounts of n best bids (0) or asks (1)"""
+        return self.__book[side].top(n)
+
+    def liquidation(self, side, amount):
+        """Notional of the best amount of bids (0) or asks (1)"""
+        return self.__book[side].liquidation(amount)
+
     def update(self, message):
-        buySell = 'Buy' in message.Flags
-        addDel = 'Add' in message.Flags
-        price = message.Price
-        amount = message.Amount
-        amountRest = message.AmountRest
+        self.updateValues(bool(message.Flags & BUY), message.Flags & ADD, message.Price, message.Amount)
+
+    def updateValues(self, buySell, addDel, price, amount):
+        side = self.__book[1-buySell]
         if addDel:
-            if not price in self.book[1-buySell]:
-                self.book[1-buySell][price] = 0
-            self.book[1-buySell][price] += amount
+            side[price] = side.get(price, 0) + amount
         else:
-            self.book[1-buySell][price] -= amount
-            if self.book[1-buySell][price] < 0:
+            amount = side[price] - amount
+            if amount < 0:
                 raise RuntimeError('Negative ammount is generated in order book')
-            if self.book[1-buySell][price] == 0:
-                del self.book[1-buySell][price]
-                
+            if amount == 0:
+                del side[price]
+            else:
+                side[price] = amount
+
     def updateBulk(self, messages):
         for name, message in messages.iterrows():
             self.update(message)
-                
\ No newline at end of file
+
+    def updateRange(self, tape, start, end):
+        """Apply messages [start, end) of a Tape"""
+        flags = tape.flags[start:end].tolist()
+        prices = tape.price[start:end].tolist()
+        amounts = tape.amount[start:end].tolist()
+        for flag, price, amount in zip(flags, prices, amounts):
+            self.updateValues(bool(flag & BUY), flag & ADD, price, amount)
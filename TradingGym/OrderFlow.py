@@ -1,25 +1,68 @@
-from datetime import datetime
+from TradingGym.Flags import decodeFlags, SELL
+from TradingGym.Tape import Tape, TapeWriter
+from TradingGym.IntervalTree import IntervalTree
+from TradingGym.Snapshots import snapshots
+from pandas import Timestamp
 import numpy as np
 import pandas as pd
 
+TXT_COLUMNS = ['Received', 'ExchTime', 'OrderId', 'Price', 'Amount', 'AmountRest', 'DealId', 'DealPrice', 'OI', 'Flags']
+TXT_DTYPES = {'Received': str, 'ExchTime': str, 'OrderId': np.int64, 'Price': np.int64, 'Amount': np.int64,
+    'AmountRest': np.int64, 'DealId': np.int64, 'DealPrice': np.int64, 'OI': np.int64, 'Flags': str}
+TXT_TIME_FORMAT = '%d.%m.%Y %H:%M:%S.%f'
+
+def _readCsv(path2file, chunksize = None):
+    return pd.read_csv(path2file, sep=';', header = None, names = TXT_COLUMNS, skiprows = 3,
+        dtype = TXT_DTYPES, chunksize = chunksize)
+
+def _parseChunk(df):
+    # explicit format keeps timestamp parsing vectorized
+    df['Received'] = pd.to_datetime(df['Received'], format = TXT_TIME_FORMAT)
+    df['ExchTime'] = pd.to_datetime(df['ExchTime'], format = TXT_TIME_FORMAT)
+    return decodeFlags(df)
+
 def readTxt(path2file, verbose = True):
     """
     Read txt with order book messages after qsh2txt.exe
     """
 
     if (verbose):
-	    print('Parsing file ', path2file)
+        print('Parsing file ', path2file)
 
-    ret = pd.read_csv(path2file, sep=';', header = None, names = ['Received', 'ExchTime', 'OrderId', 'Price', 'Amount',
-         'AmountRest', 'DealId', 'DealPrice', 'OI', 'Flags'], skiprows = 3, parse_dates = ['Received', 'ExchTime'], 
-         date_parser = lambda x: datetime.strptime(x, '%d.%m.%Y %H:%M:%S.%f'),
-         converters = {'OrderId': int, 'Price': int, 'Amount': int,'AmountRest': int, 'DealId': int, 'DealPrice': int, 'OI': int, 'Flags': str})
+    ret = _parseChunk(_readCsv(path2file))
 
     if (verbose):
         print('Finished parsing ', path2file)
 
     return ret
 
+def readTxtChunks(path2file, chunksize = 10**6):
+    """
+    Read txt after qsh2txt.exe as generator of data frames with at most chunksize messages
+    """
+    start = 0
+    for chunk in _readCsv(path2file, chunksize):
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield _parseChunk(chunk)
+
+def convertTxt(path2file, path, chunksize = 10**6, verbose = True):
+    """
+    Stream txt after qsh2txt.exe into Tape at path, memory is bounded by chunksize
+    """
+    if (verbose):
+        print('Converting file ', path2file)
+
+    writer = TapeWriter(path)
+    for chunk in readTxtChunks(path2file, chunksize):
+        writer.append(Tape.fromFrame(chunk))
+    writer.close()
+
+    if (verbose):
+        print('Finished converting ', path2file)
+
+    return path
+
 class OrderFlow:
     """
     Implements data structure to make queries to raw pandas data frame
@@ -31,28 +74,47 @@ class OrderFlow:
     __backoffice = None
     # order info for each ID
     __order_info = None
+    # IntervalTree of (timeIn, timeOut) of backoffice rows
+    __intervals = None
+
+    @property
+    def df(self):
+        return self.__df
+
+    @df.setter
+    def df(self, df):
+        self.clear()
+        self.append(df)
 
     def clear(self):
     	self.__df = None
     	self.__backoffice = None
     	self.__order_info = None
+    	self.__intervals = None
 
     def append(self, df):
+    	decodeFlags(df)
     	if (self.__df is None):
     		self.__df = df
     	else:
     		self.__df.append(df)
     	self.__backoffice = None
     	self.__order_info = None
+    	self.__intervals = None
 
     def convert(self):
         if (self.__df is None):
             raise EmptyOrderFlow('Please set df variable of OrderFlow')
 
-        self.__backoffice = self.__df[['OrderId', 'ExchTime']].groupby('OrderId').agg([np.min, np.max])
+        times = self.__df['ExchTime'].groupby(self.__df['OrderId'])
+        self.__backoffice = pd.DataFrame({'timeIn': times.min(), 'timeOut': times.max()})
         self.__order_info = self.__df.drop_duplicates(subset = 'OrderId').set_index('OrderId').loc[:, ['Price', 'Amount', 'Flags']]
-        self.__order_info['Flags'] = self.__order_info['Flags'].apply(lambda x: 1 if 'Sell' in x else -1)
+        self.__order_info['Flags'] = np.where(self.__order_info['Flags'].values & SELL, 1, -1)
         self.__order_info.rename(mapper={'Flags': 'BuySell'}, axis=1, inplace = True)
+        # rows of order info aligned with backoffice, positions of the interval tree index both
+        self.__order_info = self.__order_info.loc[self.__backoffice.index]
+        self.__intervals = IntervalTree(self.__backoffice['timeIn'].values.view(np.int64),
+            self.__backoffice['timeOut'].values.view(np.int64))
 
     def getStart(self):
     	return self.__df.iloc[0]['ExchTime']
@@ -60,22 +122,58 @@ class OrderFlow:
     def getEnd(self):
     	return self.__df.iloc[-1]['ExchTime']
 
+    def __live(self, timestamp):
+        # positions of orders seen before and after timestamp
+        if self.__intervals is None:
+            raise EmptyBackoffice('Please do OrderFlow.convert()')
+        return self.__intervals.stab(Timestamp(timestamp).value)
+
     def getIDbyTimestamp(self, timestamp):
-    	if self.__df is None:
-    		raise EmptyBackoffice('Please do OrderFlow.convert()')
+        return self.__backoffice.index.values[self.__live(timestamp)]
 
-    	return self.__backoffice[(self.__backoffice['ExchTime'].amin < timestamp) & (timestamp < self.__backoffice['ExchTime'].amax)].iloc[:,0].index.values
+    def getIDbyTimestamps(self, timestamps):
+        """List of getIDbyTimestamp for every timestamp, found in one sweep over them"""
+        if self.__intervals is None:
+            raise EmptyBackoffice('Please do OrderFlow.convert()')
+        times = [Timestamp(timestamp).value for timestamp in timestamps]
+        ids = self.__backoffice.index.values
+        return [ids[positions] for positions in self.__intervals.stabMany(times)]
 
     def query(self, timestamp):
-    	ids = self.getIDbyTimestamp(timestamp)
-
-    	return self.__order_info.loc[ids]
+        return self.__order_info.iloc[self.__live(timestamp)]
 
-    def orderBook(self, timestamp):
-        # needs at least 5 orders for bid and ask each
+    def orderBook(self, timestamp, levels = 5):
+        # needs at least levels orders for bid and ask each
         query = self.query(timestamp)
-        ask = query.loc[query['BuySell'] == 1, ['Price', 'Amount']]
-        bid = query.loc[query['BuySell'] == -1, ['Price', 'Amount']]
-        ask = ask.sort_values(by = 'Price').values[:5].reshape(1,5,2) # level 2, only 5 best
-        bid = bid.sort_values(by = 'Price', ascending = False).values[:5].reshape(1,5,2) # level 2, only 5 best
-        return bid, ask
+        sides = query['BuySell'].values
+        prices = query['Price'].values
+        amounts = query['Amount'].values
+        book = []
+        for buySell, sign in ((-1, -1), (1, 1)):
+            side = np.flatnonzero(sides == buySell)
+            if len(side) > levels:
+                # only levels best orders are sorted
+                side = side[np.argpartition(sign * prices[side], levels - 1)[:levels]]
+            side = side[np.argsort(sign * prices[side], kind = 'stable')]
+            book.append(np.stack([prices[side], amounts[side]], axis = 1)[:levels].reshape(1, levels, 2)) # level 2, only best
+        return book[0], book[1]
+
+    def orderBooks(self, timestamps, levels = 5):
+        """Lists of orderBook bids and asks for every timestamp"""
+        books = [self.orderBook(timestamp, levels) for timestamp in timestamps]
+        return [bid for bid, ask in books], [ask for bid, ask in books]
+
+    def snapshots(self, timestamps, levels = 5, path = None, tape = None):
+        """
+        Aggregated bids and asks (T, 2, levels, 2) before every of sorted timestamps in one replay,
+        see TradingGym.Snapshots.snapshots, pass Tape of df if there is one already
+        """
+        if tape is None:
+            tape = Tape.fromFrame(self.__df)
+        return snapshots(tape, timestamps, levels, path)
+
+class EmptyOrderFlow(Exception):
+    pass
+
+class EmptyBackoffice(Exception):
+    pass
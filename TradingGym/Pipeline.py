@@ -0,0 +1,144 @@
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Flags import ADD, BUY
+import numpy as np
+import threading
+import queue
+
+
+class DeltaBatch:
+    """
+    Implements decoded messages [start, end) of a Tape: per message lists for short ranges
+    and level ids with signed amounts to sum long ranges into one change per level
+    """
+    def __init__(self, tape, start, end):
+        self.start = start
+        self.end = end
+        flags = tape.flags[start:end]
+        prices = tape.price[start:end]
+        amounts = tape.amount[start:end]
+        buys = (flags & BUY) != 0
+        adds = (flags & ADD) != 0
+        self.sides = (~buys).view(np.int8).tolist() # 0 bids, 1 asks
+        self.adds = adds.tolist()
+        self.prices = prices.tolist()
+        self.amounts = amounts.tolist()
+        # zero amounts may leave empty levels, ranges with them are replayed message by message
+        self.zeros = np.flatnonzero(amounts == 0)
+        # level key is price and side (0 bids, 1 asks) in the lowest bit
+        levels, self.ids = np.unique(prices * 2 + (~buys), return_inverse=True)
+        self.signed = np.where(adds, amounts, -amounts)
+        self.level_sides = (levels & 1).tolist()
+        self.level_prices = (levels >> 1).tolist()
+
+
+class PipelinedBook(OrderBook):
+    """
+    Implements OrderBook fed by producer thread which decodes the Tape into DeltaBatch
+    ahead of the replay through a bounded queue, updateRange must be called on consecutive
+    ranges; long ranges change every level once, the book after a range is the same
+    """
+    SHORT = 64 # messages of a range applied one by one below this
+
+    def __init__(self, tape, batch=8192, depth=4):
+        super().__init__()
+        self.tape = tape
+        self.__queue = queue.Queue(depth)
+        self.__stop = threading.Event()
+        self.__current = None
+        self.__idx = 0
+        self.__thread = threading.Thread(target=self.__produce, args=(batch,), daemon=True)
+        self.__thread.start()
+
+    def __produce(self, batch):
+        for start in range(0, len(self.tape), batch):
+            try:
+                item = DeltaBatch(self.tape, start, min(start + batch, len(self.tape)))
+            except Exception as e:
+                item = e # raised by the consumer
+            while not self.__stop.is_set():
+                try:
+                    self.__queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if self.__stop.is_set() or isinstance(item, Exception):
+                return
+
+    def __batch(self, idx):
+        # batch containing message idx, the ones before it are dropped
+        current = self.__current
+        while current is None or current.end <= idx:
+            if self.__stop.is_set():
+                raise ValueError('PipelinedBook is closed')
+            current = self.__queue.get()
+            if isinstance(current, Exception):
+                raise current
+            self.__current = current
+        return current
+
+    def updateRange(self, tape, start, end):
+        """Apply messages [start, end) of the Tape, start is where the previous range ended"""
+        if start != self.__idx or tape is not self.tape:
+            raise ValueError('PipelinedBook replays its Tape in order, expected range from {}'.format(self.__idx))
+        while start < end:
+            batch = self.__batch(start)
+            stop = min(end, batch.end)
+            i, j = start - batch.start, stop - batch.start
+            zeros = batch.zeros
+            if j - i < self.SHORT or np.searchsorted(zeros, i) != np.searchsorted(zeros, j):
+                self.__applyMessages(batch, i, j)
+            else:
+                self.__applyLevels(batch, i, j)
+            start = stop
+        self.__idx = end
+
+    def __applyMessages(self, batch, i, j):
+        # OrderBook.updateValues inlined
+        book = self.book
+        sides, adds, prices, amounts = batch.sides, batch.adds, batch.prices, batch.amounts
+        for k in range(i, j):
+            side = book[sides[k]]
+            price = prices[k]
+            if adds[k]:
+                side[price] = side.get(price, 0) + amounts[k]
+            else:
+                amount = side[price] - amounts[k]
+                if amount < 0:
+                    raise RuntimeError('Negative ammount is generated in order book')
+                if amount == 0:
+                    del side[price]
+                else:
+                    side[price] = amount
+
+    def __applyLevels(self, batch, i, j):
+        # running amount of every level in message order, so a level going negative
+        # inside the range is rejected like message by message
+        book = self.book
+        order = np.argsort(batch.ids[i:j], kind='stable')
+        ids = batch.ids[i:j][order]
+        running = np.cumsum(batch.signed[i:j][order])
+        starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+        before = np.concatenate(([0], running[starts[1:] - 1]))
+        net = np.concatenate((running[starts[1:] - 1], running[-1:])) - before
+        low = np.minimum.reduceat(running, starts) - before
+        changed = np.flatnonzero((net != 0) | (low < 0))
+        levels = ids[starts[changed]].tolist()
+        for level, delta, lowest in zip(levels, net[changed].tolist(), low[changed].tolist()):
+            side = book[batch.level_sides[level]]
+            price = batch.level_prices[level]
+            amount = side.get(price, 0)
+            if amount + lowest < 0:
+                raise RuntimeError('Negative ammount is generated in order book')
+            amount += delta
+            if amount == 0:
+                del side[price]
+            else:
+                side[price] = amount
+
+    def close(self):
+        """Stop the producer thread and drop the decoded batches"""
+        self.__stop.set()
+        self.__thread.join()
+        self.__current = None
+        while not self.__queue.empty():
+            self.__queue.get_nowait()
@@ -0,0 +1,138 @@
+import time
+
+
+class Profiler:
+    """
+    Implements opt-in timing of replay phases: attach wraps methods of one Backtester or
+    TradingEnv instance (and its book), so nothing is measured or paid for without it
+    """
+    # method name -> phase
+    METHODS = {
+        'tradersBookFromAction': 'action',
+        'quoteAction': 'action',
+        'commissions': 'commissions',
+        'finalize_book': 'finalize_book',
+        'unrealizedPnl': 'unrealizedPnl',
+        'handleDeal': 'deal',
+        'handleFills': 'deal',
+        'observe': 'observe',
+        'step': 'step',
+        'reset': 'reset',
+    }
+    # strategy methods timed as phase action
+    CALLBACKS = ('action', 'onStart', 'onBookChange', 'onTrade', 'onFill', 'onTimer')
+
+    def __init__(self, callback=None, every=10**6):
+        self.callback = callback # called with stats() every `every` replayed messages
+        self.every = every
+        self.seconds = {} # phase -> own wall time
+        self.calls = {}
+        self.__wrapped = [] # (object, name, attribute before wrapping or None)
+        self.__book = None # wrapped book, only the latest one is timed
+        self.__started = None # perf_counter of attach
+        self.reset()
+
+    def reset(self):
+        """Forget measurements, wrapped methods keep being timed"""
+        for phase in self.seconds:
+            self.seconds[phase] = 0.0
+            self.calls[phase] = 0
+        self.messages = 0
+        self.wall = 0.0
+        self.__nested = 0.0
+        self.__next = self.every
+        if self.__started is not None:
+            self.__started = time.perf_counter()
+
+    def __timed(self, function, phase):
+        # own time of phase, time of other phases called inside is not counted twice
+        seconds, calls = self.seconds, self.calls
+        seconds.setdefault(phase, 0.0)
+        calls.setdefault(phase, 0)
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            outer = self.__nested
+            self.__nested = 0.0
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                seconds[phase] += elapsed - self.__nested
+                calls[phase] += 1
+                self.__nested = outer + elapsed
+        return timed
+
+    def __wrap(self, obj, name, function):
+        self.__wrapped.append((obj, name, obj.__dict__.get(name)))
+        setattr(obj, name, function)
+
+    def __unwrapBook(self):
+        if self.__book is not None:
+            book, attribute = self.__book
+            if attribute is None:
+                del book.updateRange
+            else:
+                book.updateRange = attribute
+            self.__book = None
+
+    def wrapBook(self, book):
+        """Time updateRange of book as phase book and count messages replayed by it"""
+        self.__unwrapBook()
+        update = self.__timed(book.updateRange, 'book')
+
+        def updateRange(tape, start, end):
+            update(tape, start, end)
+            self.messages += end - start
+            if self.callback is not None and self.messages >= self.__next:
+                self.__next = self.messages + self.every
+                self.callback(self.stats())
+        self.__book = (book, book.__dict__.get('updateRange'))
+        book.updateRange = updateRange
+
+    def attach(self, target, book=None):
+        """Wrap phases of Backtester or TradingEnv target until detach"""
+        self.detach()
+        for name, phase in self.METHODS.items():
+            if hasattr(target, name):
+                self.__wrap(target, name, self.__timed(getattr(target, name), phase))
+        strategy = getattr(target, 'strategy', None)
+        if strategy is not None:
+            for name in self.CALLBACKS:
+                if hasattr(strategy, name):
+                    self.__wrap(strategy, name, self.__timed(getattr(strategy, name), 'action'))
+        if book is not None:
+            self.wrapBook(book)
+        self.__started = time.perf_counter()
+
+    def detach(self):
+        """Restore wrapped methods"""
+        for obj, name, attribute in reversed(self.__wrapped):
+            if attribute is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, attribute)
+        self.__wrapped = []
+        self.__unwrapBook()
+        if self.__started is not None:
+            self.wall += time.perf_counter() - self.__started
+            self.__started = None
+
+    def stats(self):
+        """Dict of wall time, messages, deals and seconds, calls and share of wall time per phase"""
+        wall = self.wall
+        if self.__started is not None:
+            wall += time.perf_counter() - self.__started
+        phases = {phase: {'seconds': seconds, 'calls': self.calls[phase],
+            'share': seconds / wall if wall > 0 else 0.0} for phase, seconds in self.seconds.items()}
+        return {'wall': wall, 'messages': self.messages, 'deals': self.calls.get('deal', 0), 'phases': phases}
+
+    def report(self):
+        """Table of stats, the slowest phase first"""
+        stats = self.stats()
+        lines = ['{:<15}{:>12}{:>12}{:>8}'.format('phase', 'seconds', 'calls', 'share')]
+        for phase, row in sorted(stats['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<15}{:>12.4f}{:>12}{:>8.1%}'.format(phase, row['seconds'], row['calls'], row['share']))
+        lines.append('wall {:.4f} s, {} messages, {} deals'.format(stats['wall'], stats['messages'], stats['deals']))
+        return '\n'.join(lines)
@@ -0,0 +1,130 @@
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Flags import ADD, BUY, FILL, COUNTER
+
+
+class QueueBook(OrderBook):
+    """
+    Implements order-level (Level III) book: FIFO queue of orders per price level kept along
+    with aggregated OrderBook, and queue position of trader's virtual orders
+    """
+    def __init__(self):
+        super().__init__()
+        # bids, asks: price -> {order_id: [amount, seq]}, dicts keep arrival order
+        self.__queues = ({}, {})
+        # order_id -> (side, price), finds the queue of an order in O(1)
+        self.__orders = {}
+        self.__seq = 0
+        # bids, asks: price -> [volume, ahead, seq] of trader's orders, ahead is market volume
+        # before them in the queue, seq is the last market order which arrived before them
+        self.__virtual = ({}, {})
+        self.__fills = []
+
+    def queue(self, side, price):
+        """List of (order_id, amount) of bids (0) or asks (1) at price in priority order"""
+        return [(order_id, node[0]) for order_id, node in self.__queues[side].get(price, {}).items()]
+
+    def order(self, order_id):
+        """(side, price, amount) of market order or None"""
+        if order_id not in self.__orders:
+            return None
+        side, price = self.__orders[order_id]
+        return (side, price, self.__queues[side][price][order_id][0])
+
+    def ahead(self, side, price):
+        """Market volume before trader's order at price, None if there is no such order"""
+        virtual = self.__virtual[side].get(price)
+        return None if virtual is None else virtual[1]
+
+    def setOrders(self, trader_book):
+        """
+        Place trader's book as virtual orders, a level keeps its queue position
+        if its price stays and volume does not grow
+        """
+        for side in range(2):
+            virtual = self.__virtual[side]
+            levels = trader_book.book[side]
+            for price in [price for price in virtual if price not in levels]:
+                del virtual[price]
+            for price, volume in levels.items():
+                old = virtual.get(price)
+                if old is not None and volume <= old[0]:
+                    old[0] = volume
+                else:
+                    virtual[price] = [volume, self.book[side].get(price, 0), self.__seq]
+
+    def takeFills(self):
+        """List of (side, price, amount) fills of trader's orders since the last call"""
+        fills = self.__fills
+        self.__fills = []
+        return fills
+
+    def updateOrder(self, order_id, flag, price, amount):
+        side = 0 if flag & BUY else 1
+        # aggregated level, same as OrderBook.updateValues
+        levels = self.book[side]
+        if flag & ADD:
+            levels[price] = levels.get(price, 0) + amount
+        else:
+            rest = levels[price] - amount
+            if rest < 0:
+                raise RuntimeError('Negative ammount is generated in order book')
+            if rest == 0:
+                del levels[price]
+            else:
+                levels[price] = rest
+
+        queues = self.__queues[side]
+        if flag & ADD:
+            self.__seq += 1
+            queue = queues.get(price)
+            if queue is None:
+                queue = queues[price] = {}
+            old = queue.pop(order_id, None)
+            queue[order_id] = [amount + (old[0] if old else 0), self.__seq]
+            self.__orders[order_id] = (side, price)
+            return
+
+        queue = queues.get(price)
+        node = queue.get(order_id) if queue is not None else None
+        if node is None:
+            return # order is not known, e.g. it was placed before the tape starts
+        node[0] -= amount
+        if node[0] <= 0:
+            del queue[order_id]
+            if not queue:
+                del queues[price]
+            del self.__orders[order_id]
+
+        virtual = self.__virtual[side]
+        if not virtual:
+            return
+        at_price = virtual.get(price)
+        ahead = at_price is not None and node[1] <= at_price[2]
+        if ahead:
+            # order ahead of trader's one is filled or canceled
+            at_price[1] = max(at_price[1] - amount, 0)
+        if flag & FILL and not flag & COUNTER:
+            # passive fill behind trader's order or at worse price would have filled it first,
+            # trader's levels take it best first until its amount is used up
+            for trader_price in sorted(virtual, reverse=(side == 0)):
+                if amount <= 0:
+                    break
+                if (trader_price == price and not ahead) or (trader_price > price if side == 0 else trader_price < price):
+                    amount -= self.__fill(side, trader_price, virtual[trader_price], amount)
+
+    def __fill(self, side, price, order, amount):
+        amount = min(order[0], amount)
+        order[0] -= amount
+        if order[0] <= 0:
+            del self.__virtual[side][price]
+        self.__fills.append((side, price, amount))
+        return amount
+
+    def updateRange(self, tape, start, end):
+        """Apply messages [start, end) of a Tape"""
+        order_ids = tape.order_id[start:end].tolist()
+        flags = tape.flags[start:end].tolist()
+        prices = tape.price[start:end].tolist()
+        amounts = tape.amount[start:end].tolist()
+        for order_id, flag, price, amount in zip(order_ids, flags, prices, amounts):
+            self.updateOrder(order_id, flag, price, amount)
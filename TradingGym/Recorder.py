@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class Column:
+    """
+    Implements growable typed buffer of records with list-like append and indexing,
+    keeps only every n-th record if every > 1 and only the last capacity ones if it is set,
+    the last two records are always kept
+    """
+    def __init__(self, dtype=np.float64, size=1024, every=1, capacity=None):
+        self.dtype = dtype
+        self.clear(size, every, capacity)
+
+    def clear(self, size=1024, every=1, capacity=None):
+        self.every = every
+        self.capacity = None if capacity is None else max(capacity, 2)
+        self.__buffer = np.empty(size if self.capacity is None else 2 * self.capacity, dtype=self.dtype)
+        self.__start = 0
+        self.__end = 0
+        self.__count = 0 # records appended since clear
+
+    def __len__(self):
+        return self.__end - self.__start
+
+    def __index(self, i):
+        n = self.__end - self.__start
+        if i < -n or i >= n:
+            raise IndexError('record index out of range')
+        return self.__end + i if i < 0 else self.__start + i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.values()[i]
+        return self.__buffer[self.__index(i)]
+
+    def __setitem__(self, i, value):
+        self.__buffer[self.__index(i)] = value
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.values()
+        return values if dtype is None else values.astype(dtype)
+
+    def append(self, value):
+        buffer = self.__buffer
+        end = self.__end
+        if self.every > 1 and end - self.__start >= 2 and (self.__count - 2) % self.every:
+            # record leaving the last two is not on the decimation grid
+            buffer[end - 2] = buffer[end - 1]
+            end -= 1
+        if end == len(buffer):
+            if self.capacity is None:
+                buffer = np.empty(2 * len(buffer), dtype=self.dtype)
+                buffer[:end] = self.__buffer[:end]
+                self.__buffer = buffer
+            else:
+                # ring mode: move the last capacity - 1 records to the front
+                shift = end - self.capacity + 1
+                buffer[:end - shift] = buffer[shift:end]
+                self.__start = max(self.__start - shift, 0)
+                end -= shift
+        buffer[end] = value
+        self.__end = end + 1
+        self.__count += 1
+        if self.capacity is not None and self.__end - self.__start > self.capacity:
+            self.__start = self.__end - self.capacity
+
+    def values(self):
+        """Array of kept records sharing memory with the buffer until the next append"""
+        return self.__buffer[self.__start:self.__end]
+
+
+class Recorder:
+    """
+    Implements Backtester and TradingEnv time series as typed columns: int64 nanoseconds
+    of time and float64 position, realized and unrealized PnL and mid price
+    """
+    FIELDS = ['ts', 'position', 'r_pnl', 'ur_pnl', 'price']
+
+    def __init__(self, size=1024, every=1, capacity=None):
+        self.size = size
+        self.every = every # keep every n-th record, e.g. for long RL training
+        self.capacity = capacity # keep only the last records (ring mode) if set
+        self.ts = Column(np.int64, size, every, capacity)
+        self.position = Column(np.float64, size, every, capacity)
+        self.r_pnl = Column(np.float64, size, every, capacity)
+        self.ur_pnl = Column(np.float64, size, every, capacity)
+        self.price = Column(np.float64, size, every, capacity)
+
+    def clear(self):
+        """Drop all records, columns stay the same objects"""
+        for name in self.FIELDS:
+            getattr(self, name).clear(self.size, self.every, self.capacity)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def columns(self):
+        """List of ts (datetime64[ns]), position, r_pnl, ur_pnl and price arrays sharing memory"""
+        return [self.ts.values().view('M8[ns]')] + [getattr(self, name).values() for name in self.FIELDS[1:]]
+
+    def frame(self):
+        """Data frame of records indexed by time"""
+        import pandas as pd
+        ts, *values = self.columns()
+        return pd.DataFrame(dict(zip(self.FIELDS[1:], values)), index=pd.DatetimeIndex(ts, name='ts'), copy=False)
+
+    def array(self):
+        """Structured array of records, this one copies"""
+        ret = np.empty(len(self), dtype=[('ts', 'M8[ns]')] + [(name, np.float64) for name in self.FIELDS[1:]])
+        for name, values in zip(self.FIELDS, self.columns()):
+            ret[name] = values
+        return ret
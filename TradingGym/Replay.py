@@ -0,0 +1,73 @@
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Flags import ADD, SNAPSHOT
+import numpy as np
+import numbers
+
+HOUR = 3600 * 10**9
+CLOSE_AFTER = (8 * 60 + 45) * 60 * 10**9 # trading closes 8h45m after the hour nearest to its start
+
+
+def _nanos(timestamp):
+    # nanoseconds of int or anything pandas.Timestamp takes, pandas is only imported for the latter
+    if isinstance(timestamp, numbers.Integral):
+        return int(timestamp)
+    from pandas import Timestamp
+    return Timestamp(timestamp).value
+
+
+def _roundHour(nanos):
+    # same as Timestamp.round('h'): to the nearest hour, ties to the even one
+    hours, rest = divmod(nanos, HOUR)
+    if rest * 2 > HOUR or (rest * 2 == HOUR and hours % 2):
+        hours += 1
+    return hours * HOUR
+
+
+class Replay:
+    """
+    Implements market side of a session: order book replayed from Tape in strategy time steps
+    """
+    def __init__(self, tape, max_length=10**7):
+        self.tape = tape
+        self.deals = tape.deals()
+        self.book = OrderBook()
+
+        flags = tape.flags
+        self.trading_start = int(np.flatnonzero(((flags & ADD) != 0) & ((flags & SNAPSHOT) == 0))[0])
+        trading_close_time = _roundHour(int(tape.ts[self.trading_start])) + CLOSE_AFTER
+        trading_close_idx = int(np.searchsorted(tape.ts, trading_close_time)) - 1
+        self.trading_end = min(max_length + self.trading_start - 1, trading_close_idx % len(tape))
+        self.total_time = int(tape.ts[self.trading_end]) - int(tape.ts[self.trading_start])
+        self.total_idx = self.trading_end - self.trading_start
+
+        self.idx = self.trading_start
+        self.book.updateRange(tape, 0, self.idx)
+        self.strategy_time = int(tape.ts[self.trading_start])
+
+    def advance(self, sleep):
+        """
+        Move strategy time by sleep ms and replay messages up to the next transaction end,
+        yields position of every deal message right before it is applied to the book
+        """
+        self.strategy_time += sleep * 1000000
+        next_idx = self.tape.nextTransaction(self.idx, len(self.tape) - 1, self.strategy_time)
+        # deal at position d is matched right before message d-1 is applied to the book
+        first = np.searchsorted(self.deals, self.idx + 1)
+        last = np.searchsorted(self.deals, next_idx, side='right')
+        for deal in self.deals[first:last].tolist():
+            self.book.updateRange(self.tape, self.idx, deal - 1)
+            self.idx = deal - 1
+            yield self.idx
+        self.book.updateRange(self.tape, self.idx, next_idx)
+        self.idx = next_idx
+
+    def exhausted(self, sleep):
+        """True if the next step of sleep ms would pass the end of trading"""
+        return self.strategy_time + sleep * 1000000 >= self.tape.ts[self.trading_end]
+
+    def seek(self, timestamp, checkpoints):
+        """Move to timestamp restoring the book from the nearest checkpoint"""
+        self.strategy_time = _nanos(timestamp)
+        idx = max(int(np.searchsorted(self.tape.ts, self.strategy_time)), self.trading_start)
+        self.idx = self.tape.nextTransaction(idx, len(self.tape) - 1, self.strategy_time)
+        self.book = checkpoints.seek(self.tape, self.idx)
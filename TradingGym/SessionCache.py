@@ -0,0 +1,100 @@
+from TradingGym.Tape import Tape
+from TradingGym.Checkpoints import Checkpoints
+from TradingGym.Features import FeatureTable
+import shutil
+import os
+
+def sessionPath(cache_dir, key):
+    """
+    Directory of cached Tape for hdf key like '/2017-12-01'
+    """
+    return os.path.join(cache_dir, *key.strip('/').split('/'))
+
+def isCached(hdf_path, key, cache_dir):
+    marker = os.path.join(sessionPath(cache_dir, key), 'tape.json')
+    return os.path.exists(marker) and os.path.getmtime(marker) >= os.path.getmtime(hdf_path)
+
+def cacheSession(hdf_path, key, cache_dir):
+    """
+    Convert one hdf key to memory mappable Tape, safe to call from several processes
+    """
+    path = sessionPath(cache_dir, key)
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    Tape.fromFrame(_readHdf(hdf_path, key)).save(tmp_path)
+    if os.path.exists(path) and not isCached(hdf_path, key, cache_dir):
+        shutil.rmtree(path, ignore_errors=True)
+    _publish(tmp_path, path)
+    return path
+
+def _readHdf(hdf_path, key):
+    # pandas is imported by the first session parsed, replaying the cache does not need it
+    import pandas as pd
+    return pd.read_hdf(hdf_path, key=key)
+
+def _publish(tmp_path, path):
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process has just written the same data
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def convertHdf(hdf_path, cache_dir, keys=None, verbose=True):
+    """
+    Convert every (or given) key of hdf file to Tape cache
+    """
+    if keys is None:
+        import pandas as pd
+        with pd.HDFStore(hdf_path, mode='r') as store:
+            keys = store.keys()
+    for key in keys:
+        if isCached(hdf_path, key, cache_dir):
+            continue
+        if (verbose):
+            print('Caching ', key)
+        cacheSession(hdf_path, key, cache_dir)
+
+def loadSession(hdf_path, key, cache_dir=None, mmap_mode='r'):
+    """
+    Tape of hdf key, mapped from cache_dir (converted on first use) if it is given
+    """
+    if cache_dir is None:
+        return Tape.fromFrame(_readHdf(hdf_path, key))
+    if not isCached(hdf_path, key, cache_dir):
+        cacheSession(hdf_path, key, cache_dir)
+    return Tape.load(sessionPath(cache_dir, key), mmap_mode=mmap_mode)
+
+def loadCheckpoints(tape, key=None, cache_dir=None, every=10**5, seconds=None):
+    """
+    Book checkpoints of session, persisted next to its cached Tape if cache_dir is given
+    """
+    if cache_dir is None:
+        return Checkpoints.build(tape, every, seconds)
+    path = os.path.join(sessionPath(cache_dir, key), 'checkpoints')
+    if os.path.exists(os.path.join(path, 'checkpoints.json')):
+        checkpoints = Checkpoints.load(path)
+        if checkpoints.every == every and checkpoints.seconds == seconds:
+            return checkpoints
+        shutil.rmtree(path, ignore_errors=True)
+    checkpoints = Checkpoints.build(tape, every, seconds)
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    checkpoints.save(tmp_path)
+    _publish(tmp_path, path)
+    return checkpoints
+
+def loadFeatures(tape, pipeline, key=None, cache_dir=None, sleep=100, max_length=10**7):
+    """
+    FeatureTable of session, persisted next to its cached Tape if cache_dir is given
+    """
+    if cache_dir is None:
+        return pipeline.precompute(tape, sleep, max_length)
+    path = os.path.join(sessionPath(cache_dir, key), 'features')
+    if os.path.exists(os.path.join(path, 'features.json')):
+        table = FeatureTable.load(path)
+        if table.pipeline == repr(pipeline) and table.sleep == sleep:
+            return table
+        shutil.rmtree(path, ignore_errors=True)
+    table = pipeline.precompute(tape, sleep, max_length)
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    table.save(tmp_path)
+    _publish(tmp_path, path)
+    return table
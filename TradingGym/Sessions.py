@@ -0,0 +1,111 @@
+from TradingGym.SessionCache import loadSession, isCached, cacheSession
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing as mp
+import pandas as pd
+import numpy as np
+import fnmatch
+import glob
+
+def listSessions(files, keys=None):
+    """
+    List of (hdf_path, key) of hdf files (paths or glob patterns, one or a list)
+    and their keys matching keys pattern like '/2017-12-*' (all by default),
+    (hdf_path, key) pairs are taken as they are
+    """
+    if isinstance(files, str):
+        files = [files]
+    sessions = []
+    for item in files:
+        if isinstance(item, tuple):
+            sessions.append(item)
+            continue
+        for hdf_path in sorted(glob.glob(item)) or [item]:
+            with pd.HDFStore(hdf_path, mode='r') as store:
+                names = store.keys()
+            sessions += [(hdf_path, key) for key in names if keys is None or fnmatch.fnmatch(key, keys)]
+    return sessions
+
+def _cache(hdf_path, key, cache_dir):
+    # runs in a worker process, the session is mapped from cache by the scheduler
+    if not isCached(hdf_path, key, cache_dir):
+        cacheSession(hdf_path, key, cache_dir)
+
+class SessionScheduler:
+    """
+    Implements iteration over (hdf_path, key, tape) of many sessions, shuffled every pass
+    for training or in order for evaluation, the next session is loaded in background
+    while the current one is replayed
+    """
+    def __init__(self, files, keys=None, cache_dir=None, shuffle=False, seed=None, loop=True, prefetch='thread', context=None):
+        self.sessions = listSessions(files, keys)
+        if not self.sessions:
+            raise ValueError('No sessions in {}'.format(files))
+        self.cache_dir = cache_dir
+        self.shuffle = shuffle
+        self.loop = loop # start the next pass after the last session, otherwise stop
+        self.random = np.random.RandomState(seed)
+        self.passes = 0
+        # thread parses hdf next to the replay, process needs cache_dir and only writes the cache
+        if prefetch == 'process' and cache_dir is None:
+            raise ValueError('Process prefetch needs cache_dir')
+        self.prefetch = prefetch
+        if prefetch == 'thread':
+            self.__executor = ThreadPoolExecutor(1)
+        elif prefetch == 'process':
+            self.__executor = ProcessPoolExecutor(1, mp_context=mp.get_context(context))
+        else:
+            self.__executor = None
+        self.__order = []
+        self.__last = None
+        self.__pending = None # (hdf_path, key) and its future
+        self.__schedule()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return self
+
+    def __schedule(self):
+        # queue the next pass if the current one is used up, None if there is none
+        if not self.__order:
+            if self.passes and not self.loop:
+                return None
+            order = list(range(len(self.sessions)))
+            if self.shuffle:
+                self.random.shuffle(order)
+                if len(order) > 1 and self.sessions[order[0]] == self.__last:
+                    # the same day twice in a row across passes
+                    order[0], order[-1] = order[-1], order[0]
+            self.__order = order
+            self.passes += 1
+        session = self.sessions[self.__order.pop(0)]
+        if self.prefetch == 'thread':
+            self.__pending = (session, self.__executor.submit(loadSession, session[0], session[1], self.cache_dir))
+        elif self.prefetch == 'process':
+            self.__pending = (session, self.__executor.submit(_cache, session[0], session[1], self.cache_dir))
+        else:
+            self.__pending = (session, None)
+        return session
+
+    def __next__(self):
+        if self.__pending is None:
+            raise StopIteration
+        (hdf_path, key), future = self.__pending
+        if future is None or self.prefetch == 'process':
+            if future is not None:
+                future.result()
+            tape = loadSession(hdf_path, key, self.cache_dir)
+        else:
+            tape = future.result()
+        self.__last = (hdf_path, key)
+        self.__pending = None
+        self.__schedule()
+        return hdf_path, key, tape
+
+    def close(self):
+        """Stop the background worker"""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True, cancel_futures=True)
+            self.__executor = None
+        self.__pending = None
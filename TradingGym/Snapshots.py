@@ -0,0 +1,44 @@
+from TradingGym.OrderBook import OrderBook
+from pandas import DatetimeIndex
+import numpy as np
+
+
+def snapshots(tape, timestamps, levels=5, path=None, chunksize=10**5):
+    """
+    Array (T, 2, levels, 2) of bids and asks (price, amount) before every of sorted timestamps,
+    replaying tape once, zero padded, written to .npy at path in chunks if it is given
+    """
+    times = DatetimeIndex(timestamps).values.view(np.int64)
+    if np.any(np.diff(times) < 0):
+        raise ValueError('Snapshots replay the tape once, timestamps must be sorted')
+    shape = (len(times), 2, levels, 2)
+    if path is None:
+        out = np.zeros(shape, dtype=np.int64)
+    else:
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.int64, shape=shape)
+    # book at timestamp i has messages [0, positions[i]) applied
+    positions = np.searchsorted(tape.ts, times, side='left')
+    starts = np.flatnonzero(np.diff(positions, prepend=-1))
+    ends = np.append(starts[1:], len(times))
+
+    book = OrderBook()
+    row = np.zeros((2, levels, 2), dtype=np.int64)
+    used_idx = 0
+    flushed = 0
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        position = int(positions[start])
+        book.updateRange(tape, used_idx, position)
+        used_idx = position
+        row[:] = 0
+        for side in range(2):
+            prices, amounts = book.top(side, levels)
+            row[side, :len(prices), 0] = prices
+            row[side, :len(amounts), 1] = amounts
+        # timestamps without messages in between share the row
+        out[start:end] = row
+        if path is not None and end - flushed >= chunksize:
+            out.flush()
+            flushed = end
+    if path is not None:
+        out.flush()
+    return out
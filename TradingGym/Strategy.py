@@ -7,7 +7,10 @@ class Strategy:
     def __init__(self):
         self.sleep = 100 # ms
     def action(self, position, history, old_book, market_book):
-        """Override this method in subclasses"""
+        """
+        Override this method in subclasses, history is read-only TradingGym.History
+        of messages seen so far (data frame slice in Backtester.runReference)
+        """
         new_book = OrderBook()
         new_book.book = (old_book.book[0].copy(), old_book.book[1].copy())
         return new_book, self.sleep # order-book held by our strategy and time until next rebalancing
@@ -22,7 +25,56 @@ class SpreadStrategy(Strategy):
         self.offset = offset
     def action(self, position, history, old_book, market_book):
         new_book = OrderBook()
-        new_book.book[0][max(market_book.book[0].keys()) - self.offset] = self.value
-        new_book.book[1][min(market_book.book[1].keys()) + self.offset] = self.value
+        new_book.book[0][market_book.bestBid()[0] - self.offset] = self.value
+        new_book.book[1][market_book.bestAsk()[0] + self.offset] = self.value
         return new_book, self.sleep
-    
\ No newline at end of file
+    
+class EventStrategy(Strategy):
+    """
+    Implements base strategy driven by market events, Backtester calls only the callbacks
+    a subclass overrides (and onTimer every timer ms if it is overridden); every callback
+    returns new order book or None to keep the orders, old_book has fills applied already
+    """
+    def __init__(self):
+        super().__init__()
+        self.timer = self.sleep # ms between onTimer calls
+    def subscribed(self, name):
+        """True if callback name is overridden"""
+        return getattr(type(self), name) is not getattr(EventStrategy, name)
+    def onStart(self, position, history, old_book, market_book):
+        """Trading starts"""
+        return None
+    def onBookChange(self, position, history, old_book, market_book):
+        """Best bid or ask price or amount has changed after a transaction"""
+        return None
+    def onTrade(self, position, history, old_book, market_book, buySell, amount, price):
+        """Deal of aggressor side (True for buy), amount and limit price, after it is matched with trader's orders"""
+        return None
+    def onFill(self, position, history, old_book, market_book, amount, price):
+        """Trader's orders are filled by signed amount at average price"""
+        return None
+    def onTimer(self, position, history, old_book, market_book):
+        """Every timer ms of market time"""
+        return None
+
+class EventSpreadStrategy(EventStrategy):
+    """
+    Implements SpreadStrategy which moves its orders only when best prices change
+    """
+    def __init__(self, value = 10, offset = 10):
+        super().__init__()
+        self.value = value
+        self.offset = offset
+        self.quoted = None # best bid and ask of the current orders
+    def onStart(self, position, history, old_book, market_book):
+        self.quoted = None
+        return self.onBookChange(position, history, old_book, market_book)
+    def onBookChange(self, position, history, old_book, market_book):
+        quote = (market_book.bestBid()[0], market_book.bestAsk()[0])
+        if quote == self.quoted:
+            return None
+        self.quoted = quote
+        new_book = OrderBook()
+        new_book.book[0][quote[0] - self.offset] = self.value
+        new_book.book[1][quote[1] + self.offset] = self.value
+        return new_book
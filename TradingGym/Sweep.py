@@ -0,0 +1,79 @@
+from TradingGym.Backtester import Backtester
+from TradingGym.SessionCache import loadSession
+from itertools import product
+import multiprocessing as mp
+import pandas as pd
+import numpy as np
+import time
+
+def expandGrid(grid):
+    """
+    List of params dicts from dict of value lists (all combinations) or list of dicts
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in product(*(grid[name] for name in names))]
+    return [dict(params) for params in grid]
+
+def summary(ts, position, r_pnl, ur_pnl, price):
+    """
+    Summary metrics of Backtester.run output
+    """
+    pnl = np.asarray(r_pnl) + np.asarray(ur_pnl)
+    return {
+        'pnl': pnl[-1],
+        'realized': r_pnl[-1],
+        'unrealized': ur_pnl[-1],
+        'position': position[-1],
+        'max_position': np.abs(position).max(),
+        'drawdown': (np.maximum.accumulate(pnl) - pnl).max(),
+        'samples': len(ts),
+    }
+
+# session of the last task, kept so that a worker reuses it across params
+_session = (None, None, None)
+
+def _loadSession(hdf_path, key, cache_dir):
+    global _session
+    if _session[0] != (hdf_path, key, cache_dir):
+        _session = (None, None, None) # release the previous session before loading
+        _session = ((hdf_path, key, cache_dir), None, loadSession(hdf_path, key, cache_dir))
+    return _session[1], _session[2]
+
+def _runTask(task):
+    strategy_factory, hdf_path, key, cache_dir, max_length, params_list = task
+    flow, tape = _loadSession(hdf_path, key, cache_dir)
+    rows = []
+    for params in params_list:
+        backtest = Backtester(flow, strategy_factory(**params), tape=tape)
+        backtest.verbose = False
+        start = time.time()
+        result = backtest.run(max_length)
+        row = {'key': key}
+        row.update(params)
+        row.update(summary(*result))
+        row['seconds'] = time.time() - start
+        rows.append(row)
+    return rows
+
+def sweep(strategy_factory, grid, keys, hdf_path, cache_dir=None, max_length=10**6, processes=None, chunksize=None):
+    """
+    Backtest strategy_factory(**params) for every params of grid on every session key over a process pool,
+    returns data frame with one row of summary metrics per (key, params)
+    """
+    params_list = expandGrid(grid)
+    processes = processes or mp.cpu_count()
+    # split params of a key only when there are fewer keys than processes
+    chunksize = chunksize or max(1, -(-len(params_list) * len(keys) // processes))
+    tasks = [(strategy_factory, hdf_path, key, cache_dir, max_length, params_list[i:i + chunksize])
+        for key in keys for i in range(0, len(params_list), chunksize)]
+
+    rows = []
+    if processes == 1:
+        for task in tasks:
+            rows += _runTask(task)
+    else:
+        with mp.get_context().Pool(processes) as pool:
+            for task_rows in pool.imap_unordered(_runTask, tasks):
+                rows += task_rows
+    return pd.DataFrame(rows).sort_values(['key'] + list(params_list[0])).reset_index(drop=True)
@@ -0,0 +1,141 @@
+from TradingGym.Flags import parseFlags, END_OF_TRANSACTION
+import numpy as np
+import shutil
+import json
+import os
+
+
+class Tape:
+    """
+    Implements columnar representation of order flow for fast replay
+    """
+    COLUMNS = ['ts', 'order_id', 'price', 'amount', 'amount_rest', 'deal_id', 'deal_price', 'oi', 'flags']
+    DTYPES = {'ts': np.int64, 'order_id': np.int64, 'price': np.int64, 'amount': np.int64, 'amount_rest': np.int64,
+        'deal_id': np.int64, 'deal_price': np.int64, 'oi': np.int64, 'flags': np.uint32}
+
+    def __init__(self, ts, order_id, price, amount, amount_rest, deal_id, deal_price, oi, flags):
+        self.ts = ts # int64 nanoseconds of ExchTime
+        self.order_id = order_id
+        self.price = price
+        self.amount = amount
+        self.amount_rest = amount_rest
+        self.deal_id = deal_id
+        self.deal_price = deal_price
+        self.oi = oi
+        self.flags = flags # bitmask, see TradingGym.Flags
+        for column in self.COLUMNS:
+            # columns are shared by Backtesters, histories and workers, so they are read-only views
+            values = getattr(self, column).view()
+            values.flags.writeable = False
+            setattr(self, column, values)
+        self.__deals = None
+        self.__eot = None
+        self.__monotonic = None
+
+    @classmethod
+    def fromFrame(cls, df):
+        flags = df['Flags'].values
+        if flags.dtype.kind not in 'iu':
+            flags = parseFlags(flags)
+        return cls(
+            ts=np.ascontiguousarray(df['ExchTime'].values.astype('datetime64[ns]').view(np.int64)),
+            order_id=np.ascontiguousarray(df['OrderId'].values, dtype=np.int64),
+            price=np.ascontiguousarray(df['Price'].values, dtype=np.int64),
+            amount=np.ascontiguousarray(df['Amount'].values, dtype=np.int64),
+            amount_rest=np.ascontiguousarray(df['AmountRest'].values, dtype=np.int64),
+            deal_id=np.ascontiguousarray(df['DealId'].values, dtype=np.int64),
+            deal_price=np.ascontiguousarray(df['DealPrice'].values, dtype=np.int64),
+            oi=np.ascontiguousarray(df['OI'].values, dtype=np.int64),
+            flags=np.ascontiguousarray(flags, dtype=np.uint32))
+
+    def save(self, path):
+        """Write every column to path/<column>.npy, tape.json marks a complete tape"""
+        os.makedirs(path, exist_ok=True)
+        for column in self.COLUMNS:
+            np.save(os.path.join(path, column + '.npy'), getattr(self, column))
+        with open(os.path.join(path, 'tape.json'), 'w') as f:
+            json.dump({'length': len(self), 'columns': self.COLUMNS}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Map columns written by save, pages are shared between processes"""
+        with open(os.path.join(path, 'tape.json')) as f:
+            meta = json.load(f)
+        columns = {column: np.load(os.path.join(path, column + '.npy'), mmap_mode=mmap_mode)
+            for column in meta['columns']}
+        return cls(**columns)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def slice(self, start, end):
+        """Tape of messages [start, end) sharing memory with this one"""
+        return Tape(**{column: getattr(self, column)[start:end] for column in self.COLUMNS})
+
+    def deals(self):
+        """Positions of deal messages, first one for every ExchTime"""
+        if self.__deals is None:
+            idx = np.flatnonzero(self.deal_id != 0)
+            _, first = np.unique(self.ts[idx], return_index=True)
+            self.__deals = idx[np.sort(first)]
+        return self.__deals
+
+    def endOfTransaction(self):
+        """Positions of messages which close a transaction"""
+        if self.__eot is None:
+            self.__eot = np.flatnonzero(self.flags & END_OF_TRANSACTION)
+        return self.__eot
+
+    def monotonic(self):
+        if self.__monotonic is None:
+            self.__monotonic = bool(np.all(self.ts[:-1] <= self.ts[1:]))
+        return self.__monotonic
+
+    def nextTransaction(self, idx, limit, time):
+        """
+        First position in [idx, limit] which ends a transaction at or after time,
+        limit if there is no such position
+        """
+        if self.monotonic():
+            start = max(idx, int(np.searchsorted(self.ts, time)))
+            eot = self.endOfTransaction()
+            pos = np.searchsorted(eot, start)
+            if pos == len(eot):
+                return max(idx, limit)
+            return max(idx, min(int(eot[pos]), limit))
+        while idx < limit and (self.ts[idx] < time or not self.flags[idx] & END_OF_TRANSACTION):
+            idx += 1
+        return idx
+
+
+class TapeWriter:
+    """
+    Implements appending Tape chunks to disk in the format of Tape.save
+    """
+    def __init__(self, path):
+        self.path = path
+        self.length = 0
+        os.makedirs(path, exist_ok=True)
+        self.__parts = {column: open(self.__part(column), 'wb') for column in Tape.COLUMNS}
+
+    def __part(self, column):
+        return os.path.join(self.path, column + '.part')
+
+    def append(self, tape):
+        for column in Tape.COLUMNS:
+            values = np.ascontiguousarray(getattr(tape, column), dtype=Tape.DTYPES[column])
+            self.__parts[column].write(values.tobytes())
+        self.length += len(tape)
+
+    def close(self):
+        """Prepend .npy headers now that the length is known"""
+        for column in Tape.COLUMNS:
+            self.__parts[column].close()
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(Tape.DTYPES[column])),
+                'fortran_order': False, 'shape': (self.length,)}
+            with open(os.path.join(self.path, column + '.npy'), 'wb') as out, open(self.__part(column), 'rb') as part:
+                np.lib.format.write_array_header_1_0(out, header)
+                shutil.copyfileobj(part, out)
+            os.remove(self.__part(column))
+        with open(os.path.join(self.path, 'tape.json'), 'w') as f:
+            json.dump({'length': self.length, 'columns': Tape.COLUMNS}, f)
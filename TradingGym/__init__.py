@@ -1,6 +1,29 @@
-from gym.envs.registration import register
+"""
+Modules are imported on first access (TradingGym.Backtester, TradingGym.envs, ...), so the
+book and replay core loads with NumPy alone; trading-v0 is registered with gym when gym is
+imported, through the gym.envs entry point or right away if gym is imported already
+"""
+import importlib
+import sys
 
-register(
-    id='trading-v0',
-    entry_point='TradingGym.envs:TradingEnv',
-)
+ENV_ID = 'trading-v0'
+
+def register():
+    """Register trading-v0 with gym unless it is registered already"""
+    from gym.envs.registration import register as gymRegister, registry
+    if ENV_ID not in getattr(registry, 'env_specs', registry):
+        gymRegister(id=ENV_ID, entry_point='TradingGym.envs:TradingEnv')
+
+def __getattr__(name):
+    # submodule on first access, e.g. TradingGym.envs without importing it
+    if name.startswith('__'):
+        raise AttributeError(name)
+    try:
+        return importlib.import_module('{}.{}'.format(__name__, name))
+    except ModuleNotFoundError as e:
+        if e.name != '{}.{}'.format(__name__, name):
+            raise
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name)) from None
+
+if 'gym' in sys.modules:
+    register()
@@ -1 +1,18 @@
-from TradingGym.envs.trading_env import TradingEnv
+import importlib
+
+# env class -> module, imported on first access since TradingEnv pulls in gym
+ENVS = {
+    'TradingEnv': 'TradingGym.envs.trading_env',
+    'VecTradingEnv': 'TradingGym.envs.vec_trading_env',
+    'SubprocTradingEnv': 'TradingGym.envs.subproc_trading_env',
+}
+
+def __getattr__(name):
+    if name not in ENVS:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    value = getattr(importlib.import_module(ENVS[name]), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(ENVS))
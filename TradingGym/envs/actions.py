@@ -0,0 +1,102 @@
+# Gym: Imports
+from gym import spaces
+
+import numpy as np
+
+class ActionModel:
+    """
+    Implements mapping of agent's action to trader's quotes, written in place into
+    levels preallocated slots per side of ArrayBook
+    """
+    levels = 1 # slots per side
+    space = None # gym space of actions
+
+    def quote(self, action, midPrice, book):
+        """Write prices and volumes of action around midPrice into book slots and post them"""
+        raise NotImplementedError
+
+class DiscreteGrid(ActionModel):
+    """
+    Implements len(deltas)**2 discrete actions: one bid and one ask of fixed volume,
+    action is bid delta index * len(deltas) + ask delta index
+    """
+    def __init__(self, deltas=(-5, 0, 5, 10, 50, 100, 200, 500), volume=10):
+        self.deltas = list(deltas)
+        self.volume = volume
+        self.space = spaces.Discrete(len(self.deltas) ** 2)
+
+    def quote(self, action, midPrice, book):
+        delta_bid_idx, delta_ask_idx = divmod(action, len(self.deltas))
+        book.prices[0, 0] = midPrice - self.deltas[delta_bid_idx]
+        book.prices[1, 0] = midPrice + self.deltas[delta_ask_idx]
+        book.volumes[0, 0] = self.volume
+        book.volumes[1, 0] = self.volume
+        book.post(0, 1)
+        book.post(1, 1)
+
+class EnvGrid(DiscreteGrid):
+    """
+    Implements DiscreteGrid of DELTA_SEQ and VOLUME of env read at every quote,
+    so changing them on the env changes quoting like it did with convertAction
+    """
+    def __init__(self, env):
+        self.env = env
+        self.space = spaces.Discrete(len(env.DELTA_SEQ) ** 2)
+
+    @property
+    def deltas(self):
+        return self.env.DELTA_SEQ
+
+    @property
+    def volume(self):
+        return self.env.VOLUME
+
+class ContinuousQuote(ActionModel):
+    """
+    Implements Box actions (volume, delta bid, delta ask) clipped to the box,
+    one bid and one ask of that volume
+    """
+    def __init__(self, low=(0.0, -100.0, -100.0), high=(100.0, 1000.0, 1000.0)):
+        self.low = [float(value) for value in low]
+        self.high = [float(value) for value in high]
+        self.space = spaces.Box(low=np.array(self.low), high=np.array(self.high), dtype=np.float32)
+
+    def quote(self, action, midPrice, book):
+        low, high = self.low, self.high
+        volume = min(max(float(action[0]), low[0]), high[0])
+        delta_bid = min(max(float(action[1]), low[1]), high[1])
+        delta_ask = min(max(float(action[2]), low[2]), high[2])
+        book.prices[0, 0] = midPrice - delta_bid
+        book.prices[1, 0] = midPrice + delta_ask
+        book.volumes[0, 0] = volume
+        book.volumes[1, 0] = volume
+        book.post(0, 1)
+        book.post(1, 1)
+
+class MultiLevelQuote(ActionModel):
+    """
+    Implements Box actions (delta bid, delta ask, volume of level 1, ..., volume of level n):
+    n bids and n asks step apart going away from the best ones, volumes are the same
+    on both sides and clipped to [0, max_volume]
+    """
+    def __init__(self, levels=3, step=5, max_delta=1000.0, max_volume=100.0):
+        if step <= 0:
+            raise ValueError('Levels of MultiLevelQuote need positive step')
+        self.levels = levels
+        self.step = step
+        self.low = [-100.0, -100.0] + [0.0] * levels
+        self.high = [float(max_delta)] * 2 + [float(max_volume)] * levels
+        self.space = spaces.Box(low=np.array(self.low), high=np.array(self.high), dtype=np.float32)
+
+    def quote(self, action, midPrice, book):
+        low, high = self.low, self.high
+        bid = midPrice - min(max(float(action[0]), low[0]), high[0])
+        ask = midPrice + min(max(float(action[1]), low[1]), high[1])
+        for level in range(self.levels):
+            volume = min(max(float(action[2 + level]), low[2 + level]), high[2 + level])
+            book.prices[0, level] = bid - level * self.step
+            book.prices[1, level] = ask + level * self.step
+            book.volumes[0, level] = volume
+            book.volumes[1, level] = volume
+        book.post(0, self.levels)
+        book.post(1, self.levels)
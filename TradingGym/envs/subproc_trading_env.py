@@ -0,0 +1,124 @@
+from TradingGym.SessionCache import convertHdf
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+
+def _attach(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _worker(remote, i, hdf_path, key, cache_dir, env_attrs, seed, buffers):
+    from TradingGym.envs.trading_env import TradingEnv
+    handles = {}
+    arrays = {}
+    for name, (shm_name, shape, dtype) in buffers.items():
+        handles[name], arrays[name] = _attach(shm_name, shape, dtype)
+    env = TradingEnv()
+    for attr, value in env_attrs.items():
+        setattr(env, attr, value)
+    env.seed(seed)
+    # cache_dir is already converted by the parent, so the tape is only mapped here
+    env.init(hdf_path, key, cache_dir)
+    try:
+        while True:
+            cmd, slot = remote.recv()
+            if cmd == 'step':
+                observation, reward, done, info = env.step(int(arrays['actions'][slot, i]))
+                if done:
+                    info['terminal_observation'] = observation
+                    observation = env.reset()
+                arrays['rewards'][slot, i] = reward
+                arrays['dones'][slot, i] = done
+                arrays['observations'][slot, i] = observation
+                remote.send(info)
+            elif cmd == 'reset':
+                arrays['observations'][slot, i] = env.reset()
+                remote.send(None)
+            elif cmd == 'close':
+                break
+    finally:
+        arrays.clear()
+        for shm in handles.values():
+            shm.close()
+        remote.close()
+
+class SubprocTradingEnv:
+    """
+    Implements pool of TradingEnv worker processes sharing memory mapped sessions,
+    results come back through shared memory ring of depth slots
+    """
+    def __init__(self, hdf_path, keys, cache_dir, num_envs=None, env_attrs=None, seed=123, depth=2, context=None):
+        if isinstance(keys, str):
+            keys = [keys] * (num_envs or mp.cpu_count())
+        self.num_envs = len(keys)
+        self.depth = depth
+        self.slot = 0
+        self.waiting = False
+
+        # convert once here, workers only map the files and share the page cache
+        convertHdf(hdf_path, cache_dir, sorted(set(keys)), verbose=False)
+
+        layout = {
+            'actions': ((depth, self.num_envs), np.int64),
+            'observations': ((depth, self.num_envs, 2), np.float64),
+            'rewards': ((depth, self.num_envs), np.float64),
+            'dones': ((depth, self.num_envs), np.bool_),
+        }
+        self.__shms = {}
+        buffers = {}
+        for name, (shape, dtype) in layout.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            self.__shms[name] = shm
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+            buffers[name] = (shm.name, shape, dtype)
+
+        ctx = mp.get_context(context)
+        self.remotes = []
+        self.processes = []
+        for i, key in enumerate(keys):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker, daemon=True,
+                args=(work_remote, i, hdf_path, key, cache_dir, env_attrs or {}, seed + i, buffers))
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def reset(self):
+        """Observations of all envs, a view into the ring valid for depth steps"""
+        for remote in self.remotes:
+            remote.send(('reset', self.slot))
+        for remote in self.remotes:
+            remote.recv()
+        return self.observations[self.slot]
+
+    def step_async(self, actions):
+        self.slot = (self.slot + 1) % self.depth
+        self.actions[self.slot] = actions
+        for remote in self.remotes:
+            remote.send(('step', self.slot))
+        self.waiting = True
+
+    def step_wait(self):
+        """Observations, rewards and dones are views into the ring valid for depth steps"""
+        infos = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        return self.observations[self.slot], self.rewards[self.slot], self.dones[self.slot], infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.waiting:
+            self.step_wait()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        for name, shm in self.__shms.items():
+            delattr(self, name)
+            shm.close()
+            shm.unlink()
+        self.__shms = {}
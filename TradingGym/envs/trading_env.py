@@ -4,14 +4,18 @@ from gym import error, spaces, utils
 from gym.utils import seeding
 
 # Backtester: Imports
-from TradingGym.OrderFlow import OrderFlow
 from TradingGym.OrderBook import OrderBook
-import pandas as pd
-from pandas import Timedelta
+from TradingGym.ArrayBook import ArrayBook
+from TradingGym.Replay import Replay
+from TradingGym.MarketCache import CachedReplay
+from TradingGym.Recorder import Recorder
+from TradingGym.Matching import matchDeal, crossBook, matchArrayDeal, crossArrayBook
+from TradingGym.SessionCache import loadSession, loadCheckpoints, loadFeatures
+from TradingGym.Flags import BUY
+from TradingGym.envs.actions import EnvGrid
 import numpy as np
 import math
 import time
-from tqdm import tqdm
 import sys
 import os
 
@@ -21,33 +25,34 @@ class TradingEnv(gym.Env, utils.EzPickle):
 
     # Backtester: Calculate comissions
     def commissions(self, book1, book2):
+        if isinstance(book2, ArrayBook):
+            return book2.commissions(book1, self.commission)
+        # changed volume of every level of old book, then levels new in book2
         acc = 0.0
-        book_tmp = OrderBook()
-        book_tmp.book = (book1.book[0].copy(), book1.book[1].copy())
         for i in range(2):
-            for price, amount in book2.book[i].items():
-                if price in book_tmp.book[i]:
-                    book_tmp.book[i][price] -= amount
-                else:
-                    book_tmp.book[i][price] = -amount
-        for i in range(2):
-            for price, amount in book_tmp.book[i].items():
-                acc += abs(amount) * self.commission
+            old, new = book1.book[i], book2.book[i]
+            for price, amount in old.items():
+                acc += abs(amount - new.get(price, 0)) * self.commission
+            for price, amount in new.items():
+                if price not in old:
+                    acc += abs(amount) * self.commission
         return acc
     
     # Backtester: Calculate unrealized PnL
     def unrealizedPnl(self, book):
         # assuming full discharge of position now
         position = self.position[-1]
+        if self.exactLiquidation:
+            return book.liquidation(0, position) if position > 0 else -book.liquidation(1, -position)
         ret = 0.0
         if position > 0:
-            for price, value in sorted(book.book[0].items(), reverse=True):
+            for price, value in book.levels(0):
                 if position <= 0.0:
                     break
                 position -= value
                 ret += price * max(value, position)
         else:
-            for price, value in sorted(book.book[1].items(), reverse=False):
+            for price, value in book.levels(1):
                 if position >= 0.0:
                     break
                 position += value
@@ -56,54 +61,23 @@ class TradingEnv(gym.Env, utils.EzPickle):
 
     # Backtester: Match orders from traders book with market
     def finalize_book(self, book, new_book):
-        for price, value in sorted(book.book[1].items(), reverse=False):
-            bestBid = new_book.bestBid()
-            if bestBid[0] < price or math.isnan(bestBid[0]):
-                break
-            if bestBid[1] > value:
-                self.position[-1] += value
-                new_book.book[0][bestBid[0]] -= value
-            else:
-                self.position[-1] += bestBid[1]
-                del new_book.book[0][bestBid[0]]
-        for price, value in sorted(book.book[0].items(), reverse=True):
-            bestAsk = new_book.bestAsk()
-            if bestAsk[0] > price or math.isnan(bestAsk[0]):
-                break
-            if bestAsk[1] > value:
-                self.position[-1] -= value
-                new_book.book[1][bestAsk[0]] -= value
-            else:
-                self.position[-1] -= bestAsk[1]
-                del new_book.book[1][bestAsk[0]]
-
+        if isinstance(new_book, ArrayBook):
+            self.position[-1] = crossArrayBook(book, new_book, self.position[-1])
+            return new_book
+        self.position[-1] = crossBook(book, new_book, self.position[-1])
         return new_book
 
     # Backtester: Load dataset up to trading start
     def loadData(self):
-        self.deals = self.flow.df[self.flow.df.DealId != 0].drop_duplicates('ExchTime')
-        self.book = OrderBook()
-        self.used_idx = 0
-
-        self.trading_start = self.flow.df[self.flow.df.Flags.str.contains('Add') & ~self.flow.df.Flags.str.contains('Snapshot')].iloc[0]
-        trading_close_time = self.trading_start.ExchTime.round('h') + Timedelta('8h45m')
-        trading_close_idx = self.flow.df.ExchTime.searchsorted(trading_close_time)[0] - 1
-        trading_close = self.flow.df.iloc[trading_close_idx]
-        self.trading_end = self.flow.df.iloc[
-            min(self.max_length + self.trading_start.name - 1, trading_close.name)]
-        self.total_time = self.trading_end.ExchTime.value - self.trading_start.ExchTime.value
-        self.total_idx = self.trading_end.name - self.trading_start.name
-        
-        self.ts.append(self.trading_start.ExchTime)
+        self.replay = Replay(self.tape, self.max_length)
+        if self.profiler is not None:
+            self.profiler.wrapBook(self.replay.book)
+        self.__replay_moved = True # features start over at the next reset
+
+        self.ts.append(self.replay.strategy_time)
         self.position.append(0.0)
         self.r_pnl.append(0.0)
         self.ur_pnl.append(0.0)
-        
-        self.idx = self.trading_start.name
-        messages = self.flow.df.iloc[self.used_idx:self.idx]
-        self.used_idx = self.idx
-        self.book.updateBulk(messages)
-        self.strategy_time = self.trading_start.ExchTime
 
     # Gym
     def convertAction(self, action):
@@ -126,6 +100,7 @@ class TradingEnv(gym.Env, utils.EzPickle):
         self.ACTION_SPACE = 64 # volume will stay fixed, but delta bid and delta ask is divided into 8 parts
         self.DELTA_SEQ = [-5, 0, 5, 10, 50, 100, 200, 500]
         self.VOLUME = 10
+        self.setActionModel(EnvGrid(self))
         # 2 dimensions: position, mid price
         self.observation_space = spaces.Box(
             low=np.array([-1000.0, 10000.0]),
@@ -134,172 +109,281 @@ class TradingEnv(gym.Env, utils.EzPickle):
         )
 
         # Backtester Init
-        self.ts = []
-        self.position = []
-        self.r_pnl = []
-        self.ur_pnl = []
-        self.price = []
+        self.recorder = Recorder() # set its every or capacity to thin out long training
+        self.ts = self.recorder.ts
+        self.position = self.recorder.position
+        self.r_pnl = self.recorder.r_pnl
+        self.ur_pnl = self.recorder.ur_pnl
+        self.price = self.recorder.price
         self.commission = 0.0002
         self.max_length = 10**7
-        self.trader_book = OrderBook()
         self.strongPriority = False # trader's orders are matched first if True
+        self.exactLiquidation = False # unrealized PnL is liquidation value by prefix search of book depth if True
         self.sleep = 100 # ms per step
         self.EPISODE = 100
+        self.CHECKPOINT_EVERY = 10**5 # messages between book snapshots used by seek
+        self.random_start = False # reset starts episodes at random time of session if True
+        self.random = np.random.RandomState(self.seed_)
+        self.features = None # FeaturePipeline extending observation, see setFeatures
+        self.feature_table = None # FeatureTable of the session if features are precomputed
+        self.precompute_features = False
+        self.profiler = None # Profiler timing phases of step, see setProfiler
+        self.sessions = None # SessionScheduler, see setSessions
+        self.market_cache = None # MarketCache of market state per step, used by reset with start
+
+    # Gym: Extend observation with features
+    def setFeatures(self, pipeline, precompute=False):
+        """
+        Observation becomes float32 vector of position, mid price and pipeline values,
+        the same array is returned every step, precomputed features are looked up by time
+        """
+        self.features = pipeline
+        self.precompute_features = precompute
+        self.observation = np.zeros(2 + pipeline.size, dtype=np.float32)
+        self.__feature_values = self.observation[2:]
+        self.observation_space = spaces.Box(
+            low=np.concatenate([[-1000.0, 10000.0], np.full(pipeline.size, -np.inf)]),
+            high=np.concatenate([[1000.0, 200000.0], np.full(pipeline.size, np.inf)]),
+            dtype=np.float32
+        )
+        self.__replay_moved = True
+        if hasattr(self, 'tape'):
+            self.loadFeatures()
+
+    # Gym: Choose how actions become trader's quotes
+    def setActionModel(self, model):
+        """
+        Quote actions of model (see envs.actions) into preallocated ArrayBook slots,
+        action_space becomes the space of model; subclasses overriding convertAction
+        or tradersBookFromAction keep building OrderBook from them
+        """
+        cls = type(self)
+        if cls.convertAction is not TradingEnv.convertAction or cls.tradersBookFromAction is not TradingEnv.tradersBookFromAction:
+            model = None
+        self.action_model = model
+        if model is None:
+            self.trader_book = OrderBook()
+            return
+        self.action_space = model.space
+        if isinstance(model.space, spaces.Discrete):
+            self.ACTION_SPACE = model.space.n
+        # quotes of a step are written into the book which is not the current one
+        self.__books = (ArrayBook(model.levels), ArrayBook(model.levels))
+        self.trader_book = self.__books[0]
+
+    # Backtester: Empty trader's book, the previous one is left as it is
+    def clearTraderBook(self):
+        if self.action_model is None:
+            self.trader_book = OrderBook()
+        else:
+            self.trader_book = self.__spareBook()
+            self.trader_book.clear()
+
+    def __spareBook(self):
+        books = self.__books
+        return books[1] if self.trader_book is books[0] else books[0]
+
+    # Backtester: Time phases of step and reset
+    def setProfiler(self, profiler):
+        """Attach Profiler to this env, None detaches the current one"""
+        if self.profiler is not None:
+            self.profiler.detach()
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self, self.replay.book if hasattr(self, 'replay') else None)
+
+    # Backtester: Precompute features of the session if asked
+    def loadFeatures(self):
+        self.feature_table = None
+        if self.features is not None and self.precompute_features:
+            self.feature_table = loadFeatures(self.tape, self.features, self.key, self.cache_dir, self.sleep, self.max_length)
+
+    # Gym: Observation after messages from start
+    def observe(self, start):
+        if self.features is None:
+            return (self.position[-1], self.price[-1])
+        self.observation[0] = self.position[-1]
+        self.observation[1] = self.price[-1]
+        if self.feature_table is not None:
+            self.__feature_values[:] = self.feature_table.at(self.replay.strategy_time)
+        else:
+            self.__feature_values[:] = self.features.update(self.replay.book, self.tape, start, self.replay.idx)
+        return self.observation
         
 
-    def init(self, hdf_path, key):
+    def init(self, hdf_path, key, cache_dir=None, tape=None):
+        """
+        Load session key, memory mapped from cache_dir if it is given (see SessionCache),
+        tape of the session is used instead if it is given
+        """
         self.hdf_path = hdf_path
         self.key = key
+        self.cache_dir = cache_dir
 
-        self.flow = OrderFlow()
-        self.flow.df = pd.read_hdf(self.hdf_path, key=key)
+        self.tape = loadSession(self.hdf_path, key, cache_dir) if tape is None else tape
+        self.checkpoints = None
         self.loadData()
+        self.loadFeatures()
+
+    # Backtester: Take sessions from scheduler instead of one key
+    def setSessions(self, sessions):
+        """
+        Replay sessions of SessionScheduler one after another, the next one is
+        loaded in background and replaces the current one when it is exhausted
+        """
+        self.sessions = sessions
+        self.nextSession()
+
+    # Backtester: Switch to the next session of scheduler, False if there is none
+    def nextSession(self):
+        session = next(self.sessions, None)
+        if session is None:
+            return False
+        hdf_path, key, tape = session
+        self.init(hdf_path, key, self.sessions.cache_dir, tape)
+        return True
+
+    # Backtester: Move replay to timestamp from the nearest book checkpoint
+    def seek(self, timestamp):
+        if self.checkpoints is None:
+            self.checkpoints = loadCheckpoints(self.tape, self.key, self.cache_dir, self.CHECKPOINT_EVERY)
+        if isinstance(self.replay, CachedReplay):
+            self.replay = Replay(self.tape, self.max_length)
+        self.replay.seek(timestamp, self.checkpoints)
+        if self.profiler is not None:
+            self.profiler.wrapBook(self.replay.book)
+        self.clearTraderBook()
 
 
     # Backtester: Handle deal message
-    def handleDeal(self, deal):
-        buySell = 'Buy' in deal.Flags
-        deal_amount = deal.Amount
-        deal_price = deal.Price
-        deal_time = deal.ExchTime
+    def handleDeal(self, idx):
+        buySell = bool(self.tape.flags[idx] & BUY)
+        deal_amount = int(self.tape.amount[idx])
+        deal_price = int(self.tape.price[idx])
+        deal_time = self.tape.ts[idx]
 
         self.ts.append(deal_time)
         self.position.append(self.position[-1])
         self.r_pnl.append(self.r_pnl[-1])
-        self.ur_pnl.append(self.unrealizedPnl(self.book))
-        self.price.append((max(self.book.book[0].keys()) + min(self.book.book[1].keys())) / 2)
+        self.ur_pnl.append(self.unrealizedPnl(self.replay.book))
+        self.price.append(self.replay.book.midPrice())
 
-
-        if buySell:
-            """Buy trader's asks"""
-            for price, amount in sorted(self.book.book[1].items(), reverse=False):
-                bestAsk = self.new_book.bestAsk()
-                if (bestAsk[0] > deal_price or bestAsk[0] == float('nan')) and price > deal_price:
-                    break
-                if bestAsk[0] != float('nan') and (bestAsk[0] < price or (bestAsk[0] == price and self.strongPriority)):
-                    if bestAsk[1] >= deal_amount:
-                        self.new_book.book[1][bestAsk[0]] -= deal_amount
-                        
-                        self.position[-1] -= deal_amount
-                        self.r_pnl[-1] += deal_amount * bestAsk[0]
-                        
-                        deal_amount = 0
-                    else:
-                        del self.new_book.book[1][bestAsk[0]]
-                        
-                        self.position[-1] -= bestAsk[1]
-                        self.r_pnl[-1] += bestAsk[1] * bestAsk[0]
-                        
-                        deal_amount -= bestAsk[1]
-                else:
-                    deal_amount -= amount
-                if deal_amount <= 0:
-                    break
-            if deal_amount > 0:
-                pass # assuming that order was FillOrKill
-        else:
-            """Sell trader's bids"""
-            for price, amount in sorted(self.book.book[0].items(), reverse=True):
-                bestBid = self.new_book.bestBid()
-                if (bestBid[0] < deal_price or bestBid[0] == float('nan')) and price < deal_price:
-                    break
-                if bestBid[0] != float('nan') and (bestBid[0] > price or (bestBid[0] == price and self.strongPriority)):
-                    if bestBid[1] >= deal_amount:
-                        self.new_book.book[0][bestBid[0]] -= deal_amount
-                        
-                        self.position[-1] += deal_amount
-                        self.r_pnl[-1] -= deal_amount * bestBid[0]
-                        
-                        deal_amount = 0
-                    else:
-                        del self.new_book.book[0][bestBid[0]]
-                        
-                        self.position[-1] += bestBid[1]
-                        self.r_pnl[-1] -= bestBid[1] * bestBid[0]
-                        
-                        deal_amount -= bestBid[1]
-                else:
-                    deal_amount -= amount
-                if deal_amount <= 0:
-                    break
-            if deal_amount > 0:
-                pass # assuming that order was FillOrKill
+        # unfilled rest of deal is assumed to be FillOrKill
+        if self.action_model is not None:
+            self.position[-1], self.r_pnl[-1] = matchArrayDeal(self.replay.book, self.new_book, buySell,
+                deal_amount, deal_price, self.position[-1], self.r_pnl[-1], self.strongPriority)
+            return
+        self.position[-1], self.r_pnl[-1] = matchDeal(self.replay.book, self.new_book, buySell,
+            deal_amount, deal_price, self.position[-1], self.r_pnl[-1], self.strongPriority)
 
     # Backtester: adjust traders book with action | IMPLEMENT
     def tradersBookFromAction(self, action):
         volume, delta_bid, delta_ask = action
 
         new_book = OrderBook()
-        midPrice = (max(self.book.book[0].keys()) + min(self.book.book[1].keys())) / 2
+        midPrice = self.replay.book.midPrice()
         new_book.book[0][midPrice - delta_bid] = volume
         new_book.book[1][midPrice + delta_ask] = volume
 
         return new_book
 
+    # Backtester: quote action into the spare ArrayBook, nothing is allocated
+    def quoteAction(self, action):
+        new_book = self.__spareBook()
+        self.action_model.quote(action, self.replay.book.midPrice(), new_book)
+        return new_book
+
     # Gym: Set random seed
     def seed(self, seed=None):
-        self.seed_ = seed or DEFAULT_SEED
+        self.seed_ = seed or self.DEFAULT_SEED
+        self.random = np.random.RandomState(self.seed_)
+        return [self.seed_]
 
     # Gym: Perform one step
     def step(self, action):
-        action = self.convertAction(action)
-
-        self.ts.append(self.strategy_time)
+        self.ts.append(self.replay.strategy_time)
         self.position.append(self.position[-1])
-        self.new_book = self.tradersBookFromAction(action)
+        if self.action_model is None:
+            self.new_book = self.tradersBookFromAction(self.convertAction(action))
+        else:
+            self.new_book = self.quoteAction(action)
         self.r_pnl.append(self.r_pnl[-1] - self.commissions(self.trader_book, self.new_book))
-        self.new_book = self.finalize_book(self.book, self.new_book)
-        self.ur_pnl.append(self.unrealizedPnl(self.book))
-        self.price.append((max(self.book.book[0].keys()) + min(self.book.book[1].keys())) / 2)
+        self.new_book = self.finalize_book(self.replay.book, self.new_book)
+        self.ur_pnl.append(self.unrealizedPnl(self.replay.book))
+        self.price.append(self.replay.book.midPrice())
         self.trader_book = self.new_book        
 
 
-        self.strategy_time += Timedelta(np.timedelta64(self.sleep, 'ms'))
-        while self.flow.df.iloc[self.idx].ExchTime < self.strategy_time or 'EndOfTransaction' not in self.flow.df.iloc[self.idx].Flags:
-            message = self.flow.df.iloc[self.idx]
-            if self.idx+1 in self.deals.index:
-                self.handleDeal(message)
-
-            self.book.update(message)
-            self.idx += 1
-        self.used_idx = self.idx
+        if isinstance(self.replay, CachedReplay) and self.replay.finished():
+            # recorded steps are used up, the book is restored from checkpoints
+            trader_book = self.trader_book
+            self.seek(self.replay.strategy_time)
+            self.trader_book = trader_book
+        start = self.replay.idx
+        for deal in self.replay.advance(self.sleep):
+            self.handleDeal(deal)
         self.steps += 1
 
-        position = self.position[-1]
-        mid_price = self.price[-1]
-        observation = (position, mid_price)
+        observation = self.observe(start)
         reward = (self.r_pnl[-1] + self.ur_pnl[-1]) - (self.r_pnl[-2] + self.ur_pnl[-2])
         done = False if self.steps < self.EPISODE else True
         info = {}
 
-        if self.strategy_time + Timedelta(np.timedelta64(self.sleep, 'ms')) >= self.trading_end.ExchTime:
-            print("Exhausted key: %s" % self.key)
-            self.init(self.hdf_path, self.key)
+        if self.replay.exhausted(self.sleep):
+            info['session_end'] = True
+            info['key'] = self.key
+            if self.sessions is None:
+                # the session starts over from its tape, nothing is loaded again
+                self.init(self.hdf_path, self.key, self.cache_dir, self.tape)
+            elif not self.nextSession():
+                # scheduler without loop has run out, the last session starts over
+                info['sessions_done'] = True
+                self.init(self.hdf_path, self.key, self.cache_dir, self.tape)
             done = True
 
         return observation, reward, done, info
 
     # Gym: Reset for new episode
-    def reset(self):
+    def reset(self, start=None):
+        """
+        Continue from the current time, or seek to start (random time if random_start is set);
+        features keep their state when the episode continues, precomputed ones need that
+        """
+        if self.feature_table is not None and (start is not None or self.random_start):
+            raise ValueError('Precomputed features are on the grid of steps from session start, '
+                'reset with start or random_start needs setFeatures without precompute')
+        if start is None and self.random_start:
+            first = int(self.tape.ts[self.replay.trading_start])
+            last = int(self.tape.ts[self.replay.trading_end]) - (self.EPISODE + 1) * self.sleep * 1000000
+            start = first + int(self.random.random_sample() * max(last - first, 0))
+        if start is not None and self.market_cache is not None:
+            # recorded market path of the episode instead of the book replay
+            self.replay = self.market_cache.replay(self, start)
+            self.clearTraderBook()
+        elif start is not None:
+            self.seek(start)
+
         self.steps = 0
 
-        self.ts = []
-        self.position = []
-        self.r_pnl = []
-        self.ur_pnl = []
-        self.price = []
+        self.recorder.clear()
 
-        self.ts.append(self.strategy_time)
+        self.ts.append(self.replay.strategy_time)
         self.position.append(0.0)
         self.r_pnl.append(0.0)
         self.ur_pnl.append(0.0)
-        self.price.append((max(self.book.book[0].keys()) + min(self.book.book[1].keys())) / 2)
-
-        position = self.position[-1]
-        mid_price = self.price[-1]
-        observation = (position, mid_price)
-
-        return observation
+        self.price.append(self.replay.book.midPrice())
+
+        if start is not None:
+            self.__replay_moved = True
+        if self.features is not None and not self.__replay_moved:
+            # the book is the one observed by the last step, so are the features
+            self.observation[0] = self.position[-1]
+            self.observation[1] = self.price[-1]
+            return self.observation
+        self.__replay_moved = False
+        if self.features is not None:
+            self.features.reset()
+        return self.observe(self.replay.idx)
 
     # Gym: Show PnL graph
     def render(self, mode='human', close=False):
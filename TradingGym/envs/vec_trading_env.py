@@ -0,0 +1,256 @@
+# Gym: Imports
+from gym import spaces
+
+# Backtester: Imports
+from TradingGym.Replay import Replay
+from TradingGym.SessionCache import loadSession, loadCheckpoints
+from TradingGym.Flags import BUY
+from TradingGym.Matching import matchLevels
+from itertools import islice
+import numpy as np
+
+class VecTradingEnv:
+    """
+    Implements K independent TradingEnv sessions stepped together, accounting is kept as struct of arrays
+    """
+    DEPTH = 8 # market levels per side copied each step for batched accounting
+
+    def __init__(self, num_envs):
+        self.num_envs = num_envs
+
+        # same action and observation model as TradingEnv
+        self.action_space = spaces.Box(
+            low=np.array([0.0, -100.0, -100.0]),
+            high=np.array([100.0, 1000.0, 1000.0]),
+            dtype=np.float32
+        )
+        self.ACTION_SPACE = 64
+        self.DELTA_SEQ = [-5, 0, 5, 10, 50, 100, 200, 500]
+        self.VOLUME = 10
+        self.observation_space = spaces.Box(
+            low=np.array([-1000.0, 10000.0]),
+            high=np.array([1000.0, 200000.0]),
+            dtype=np.float32
+        )
+
+        self.commission = 0.0002
+        self.max_length = 10**7
+        self.strongPriority = False # trader's orders are matched first if True
+        self.sleep = 100 # ms per step
+        self.EPISODE = 100
+        self.CHECKPOINT_EVERY = 10**5
+
+        # accounting of the last two records of every env, reward is their difference
+        self.position = np.zeros(num_envs)
+        self.r_pnl = np.zeros(num_envs)
+        self.ur_pnl = np.zeros(num_envs)
+        self.r_pnl_prev = np.zeros(num_envs)
+        self.ur_pnl_prev = np.zeros(num_envs)
+        self.price = np.zeros(num_envs)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+
+        # trader's book: one level of bids (0) and asks (1) per env
+        self.trader_price = np.zeros((num_envs, 2))
+        self.trader_volume = np.zeros((num_envs, 2))
+        self.trader_live = np.zeros((num_envs, 2), dtype=bool)
+
+        # DEPTH best market levels, nan padded
+        self.market_price = np.full((num_envs, 2, self.DEPTH), np.nan)
+        self.market_amount = np.zeros((num_envs, 2, self.DEPTH))
+
+    def init(self, hdf_path, keys, cache_dir=None, starts=None):
+        """
+        Load one session key per env (single key is shared by all), optionally
+        starting env i at timestamp starts[i]
+        """
+        if isinstance(keys, str):
+            keys = [keys] * self.num_envs
+        assert(len(keys) == self.num_envs)
+        self.hdf_path = hdf_path
+        self.keys = list(keys)
+        self.cache_dir = cache_dir
+
+        tapes = {key: loadSession(hdf_path, key, cache_dir) for key in set(self.keys)}
+        self.tapes = [tapes[key] for key in self.keys]
+        self.replays = [Replay(tape, self.max_length) for tape in self.tapes]
+        self.trader_live[:] = False
+        if starts is not None:
+            checkpoints = {key: loadCheckpoints(tapes[key], key, cache_dir, self.CHECKPOINT_EVERY) for key in tapes}
+            for i, start in enumerate(starts):
+                if start is not None:
+                    self.replays[i].seek(start, checkpoints[self.keys[i]])
+
+    def __mids(self):
+        return np.array([replay.book.midPrice() for replay in self.replays])
+
+    def __copyMarket(self):
+        self.market_price.fill(np.nan)
+        for i, replay in enumerate(self.replays):
+            for side in range(2):
+                prices, amounts = replay.book.top(side, self.DEPTH)
+                self.market_price[i, side, :len(prices)] = prices
+                self.market_amount[i, side, :len(amounts)] = amounts
+
+    def __resetAccounting(self, mask):
+        self.steps[mask] = 0
+        self.position[mask] = 0.0
+        self.r_pnl[mask] = 0.0
+        self.ur_pnl[mask] = 0.0
+        self.r_pnl_prev[mask] = 0.0
+        self.ur_pnl_prev[mask] = 0.0
+        self.price[mask] = self.__mids()[mask]
+
+    def __observation(self):
+        return np.stack([self.position, self.price], axis=1)
+
+    def reset(self):
+        self.__resetAccounting(np.ones(self.num_envs, dtype=bool))
+        return self.__observation()
+
+    # Backtester: commissions of replacing one level books, summed in the order of TradingEnv.commissions
+    def commissions(self, price, volume, live):
+        acc = np.zeros(self.num_envs)
+        for side in range(2):
+            same = self.trader_live[:, side] & live[:, side] & (self.trader_price[:, side] == price[:, side])
+            old = np.where(same, np.abs(self.trader_volume[:, side] - volume[:, side]), self.trader_volume[:, side])
+            acc += np.where(self.trader_live[:, side], old * self.commission, 0.0)
+            acc += np.where(live[:, side] & ~same, volume[:, side] * self.commission, 0.0)
+        return acc
+
+    # Backtester: match trader's book with crossing market levels
+    def finalize_book(self):
+        for side, sign in ((0, 1.0), (1, -1.0)):
+            other = 1 - side
+            active = self.trader_live[:, side].copy()
+            for j in range(self.DEPTH):
+                price = self.market_price[:, other, j]
+                value = self.market_amount[:, other, j]
+                crossing = (self.trader_price[:, side] >= price) if side == 0 else (self.trader_price[:, side] <= price)
+                go = active & ~np.isnan(price) & crossing
+                partial = go & (self.trader_volume[:, side] > value)
+                full = go & ~partial
+                self.position += sign * np.where(partial, value, 0.0)
+                self.position += sign * np.where(full, self.trader_volume[:, side], 0.0)
+                self.trader_volume[:, side] -= np.where(partial, value, 0.0)
+                self.trader_live[full, side] = False
+                active = partial
+            for i in np.flatnonzero(active):
+                self.__finalizeDeep(i, side)
+
+    def __finalizeDeep(self, i, side):
+        sign = 1.0 if side == 0 else -1.0
+        for price, value in islice(self.replays[i].book.levels(1 - side), self.DEPTH, None):
+            if not self.trader_live[i, side]:
+                break
+            trader_price = self.trader_price[i, side]
+            if (trader_price < price) if side == 0 else (trader_price > price):
+                break
+            if self.trader_volume[i, side] > value:
+                self.position[i] += sign * value
+                self.trader_volume[i, side] -= value
+            else:
+                self.position[i] += sign * self.trader_volume[i, side]
+                self.trader_live[i, side] = False
+
+    # Backtester: liquidation value of positions, batched over DEPTH levels
+    def unrealizedPnl(self):
+        ret = np.zeros(self.num_envs)
+        long = self.position > 0
+        rest = self.position.copy()
+        envs = np.arange(self.num_envs)
+        side = np.where(long, 0, 1)
+        for j in range(self.DEPTH):
+            price = self.market_price[envs, side, j]
+            value = self.market_amount[envs, side, j]
+            present = ~np.isnan(price)
+            buy = long & present & (rest > 0.0)
+            sell = ~long & present & (rest < 0.0)
+            rest = np.where(buy, rest - value, np.where(sell, rest + value, rest))
+            ret += np.where(buy, price * np.maximum(value, rest), 0.0)
+            ret -= np.where(sell, price * np.maximum(value, -rest), 0.0)
+        deep = np.where(long, rest > 0.0, rest < 0.0) & ~np.isnan(self.market_price[envs, side, -1])
+        for i in np.flatnonzero(deep):
+            ret[i] += self.__unrealizedScalar(i, rest[i], self.DEPTH)
+        return ret
+
+    def __unrealizedScalar(self, i, position, skip=0):
+        ret = 0.0
+        book = self.replays[i].book
+        if position > 0:
+            for price, value in islice(book.levels(0), skip, None):
+                if position <= 0.0:
+                    break
+                position -= value
+                ret += price * max(value, position)
+        else:
+            for price, value in islice(book.levels(1), skip, None):
+                if position >= 0.0:
+                    break
+                position += value
+                ret -= price * max(value, -position)
+        return ret
+
+    # Backtester: Handle deal message of env i
+    def handleDeal(self, i, idx):
+        tape = self.tapes[i]
+        book = self.replays[i].book
+        buySell = bool(tape.flags[idx] & BUY)
+        deal_amount = int(tape.amount[idx])
+        deal_price = int(tape.price[idx])
+
+        self.r_pnl_prev[i] = self.r_pnl[i]
+        self.ur_pnl_prev[i] = self.ur_pnl[i]
+        self.ur_pnl[i] = self.__unrealizedScalar(i, self.position[i])
+        self.price[i] = book.midPrice()
+
+        side = 1 if buySell else 0
+        first, self.position[i], self.r_pnl[i] = matchLevels(book,
+            self.trader_price[i, side:side + 1], self.trader_volume[i, side:side + 1],
+            0 if self.trader_live[i, side] else 1, buySell, deal_amount, deal_price,
+            self.position[i], self.r_pnl[i], self.strongPriority)
+        self.trader_live[i, side] = first == 0
+
+    # Gym: Perform one step of every env
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        delta = np.asarray(self.DELTA_SEQ)
+        mids = self.__mids()
+
+        # Backtester: trader's book from action
+        price = np.stack([mids - delta[actions // 8], mids + delta[actions % 8]], axis=1)
+        volume = np.full((self.num_envs, 2), float(self.VOLUME))
+        live = np.ones((self.num_envs, 2), dtype=bool)
+
+        self.r_pnl_prev[:] = self.r_pnl
+        self.ur_pnl_prev[:] = self.ur_pnl
+        self.r_pnl -= self.commissions(price, volume, live)
+        self.trader_price[:] = price
+        self.trader_volume[:] = volume
+        self.trader_live[:] = live
+        self.__copyMarket()
+        self.finalize_book()
+        self.ur_pnl[:] = self.unrealizedPnl()
+        self.price[:] = mids
+
+        for i, replay in enumerate(self.replays):
+            for deal in replay.advance(self.sleep):
+                self.handleDeal(i, deal)
+        self.steps += 1
+
+        observation = self.__observation()
+        reward = (self.r_pnl + self.ur_pnl) - (self.r_pnl_prev + self.ur_pnl_prev)
+        done = self.steps >= self.EPISODE
+        info = [{} for i in range(self.num_envs)]
+
+        for i, replay in enumerate(self.replays):
+            if replay.exhausted(self.sleep):
+                self.replays[i] = Replay(self.tapes[i], self.max_length)
+                done[i] = True
+
+        # finished envs start the next episode right away
+        for i in np.flatnonzero(done):
+            info[i]['terminal_observation'] = observation[i].copy()
+        self.__resetAccounting(done)
+        observation[done] = self.__observation()[done]
+
+        return observation, reward, done, info
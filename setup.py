@@ -10,6 +10,10 @@ setup(
     license='Apache 2.0',
     packages=['TradingGym', 'TradingGym.envs'],
     zip_safe=False,
+    # gym calls TradingGym.register when it is imported
+    entry_points={'gym.envs': ['__root__ = TradingGym:register']},
     install_requires=['gym', 'seaborn', 'matplotlib', 'tqdm', 'pandas',
-     'tables', 'numpy', 'tensorflow', 'keras', 'keras-rl', 'notebook']
+     'tables', 'numpy', 'tensorflow', 'keras', 'keras-rl', 'notebook'],
+    # matching kernels of TradingGym.Matching are compiled with numba if it is installed
+    extras_require={'jit': ['numba'], 'test': ['pytest', 'numba']}
 )
@@ -0,0 +1,46 @@
+"""
+Backtester.runEvents against Backtester.run on synthetic sessions
+"""
+from TradingGym.Backtester import Backtester
+from TradingGym.Benchmark import syntheticFlow
+from TradingGym.Strategy import Strategy, EventSpreadStrategy
+from TradingGym.Flags import COUNTER, FILL, END_OF_TRANSACTION
+from TradingGym.Tape import Tape
+import pytest
+
+
+def withoutAggressors(tape):
+    # passive fills only, each one a transaction, so deals start transactions
+    keep = (tape.flags & COUNTER) == 0
+    columns = {column: getattr(tape, column)[keep].copy() for column in Tape.COLUMNS}
+    fills = (columns['flags'] & FILL) != 0
+    columns['flags'][fills] |= END_OF_TRANSACTION
+    return Tape(**columns)
+
+
+@pytest.fixture(scope='module', params=['aggressors', 'passive'])
+def tape(request):
+    tape = Tape.fromFrame(syntheticFlow(20000, 20, 0))
+    # the generated session may stop inside a transaction
+    tape = tape.slice(0, int(tape.endOfTransaction()[-1]) + 1)
+    return tape if request.param == 'aggressors' else withoutAggressors(tape)
+
+
+def matchedDeals(strategy, tape):
+    backtest = Backtester(None, strategy, tape=tape)
+    backtest.verbose = False
+    calls = []
+    handleDeal = backtest.handleDeal
+
+    def recorded(book, new_book, buySell, deal_amount, deal_price):
+        calls.append((buySell, deal_amount, deal_price))
+        handleDeal(book, new_book, buySell, deal_amount, deal_price)
+    backtest.handleDeal = recorded
+    backtest.run(len(tape))
+    return calls
+
+
+def test_run_events_matches_deals_of_run(tape):
+    expected = matchedDeals(Strategy(), tape)
+    assert expected
+    assert matchedDeals(EventSpreadStrategy(), tape) == expected
@@ -0,0 +1,27 @@
+"""
+IntervalTree against a scan of all intervals
+"""
+from TradingGym.IntervalTree import IntervalTree
+import numpy as np
+import pytest
+
+
+def scan(starts, ends, t):
+    return np.flatnonzero((starts < t) & (ends > t))
+
+
+@pytest.mark.parametrize('n', [0, 10, 1000])
+def test_stab(n):
+    rng = np.random.RandomState(n)
+    starts = rng.randint(0, 500, size=n)
+    ends = starts + rng.randint(-5, 100, size=n) # some intervals are empty
+    tree = IntervalTree(starts, ends)
+    times = rng.randint(-10, 620, size=300)
+    times[:20] = starts[:20] if n >= 20 else times[:20] # endpoints are not contained
+    expected = [scan(starts, ends, t) for t in times]
+    for t, positions in zip(times, expected):
+        assert np.array_equal(tree.stab(t), positions)
+    found = tree.stabMany(times)
+    assert len(found) == len(times)
+    for positions, other in zip(found, expected):
+        assert np.array_equal(positions, other)
@@ -0,0 +1,165 @@
+"""
+Matching kernels against the reference loops they replaced, pure Python and JIT
+(the latter only when numba can be imported)
+"""
+from TradingGym import Matching
+from TradingGym.Matching import matchDeal, crossBook
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Backtester import Backtester
+from TradingGym.Benchmark import syntheticFlow
+from TradingGym.Strategy import SpreadStrategy
+from TradingGym.Tape import Tape
+import numpy as np
+import pytest
+import math
+
+KERNELS = [False, pytest.param(True, marks=pytest.mark.skipif(Matching.njit is None, reason='numba is not installed'))]
+
+
+@pytest.fixture(params=KERNELS, ids=['python', 'jit'])
+def jit(request, monkeypatch):
+    monkeypatch.setattr(Matching, 'useJit', request.param)
+    return request.param
+
+
+def referenceMatchDeal(book, new_book, buySell, deal_amount, deal_price, position, r_pnl, strong=False):
+    # loop of Backtester.handleDeal before the kernels
+    if buySell:
+        for price, amount in book.levels(1):
+            bestAsk = new_book.bestAsk()
+            if (bestAsk[0] > deal_price or bestAsk[0] == float('nan')) and price > deal_price:
+                break
+            if bestAsk[0] != float('nan') and (bestAsk[0] < price or (bestAsk[0] == price and strong)):
+                if bestAsk[1] >= deal_amount:
+                    new_book.book[1][bestAsk[0]] -= deal_amount
+                    position -= deal_amount
+                    r_pnl += deal_amount * bestAsk[0]
+                    deal_amount = 0
+                else:
+                    del new_book.book[1][bestAsk[0]]
+                    position -= bestAsk[1]
+                    r_pnl += bestAsk[1] * bestAsk[0]
+                    deal_amount -= bestAsk[1]
+            else:
+                deal_amount -= amount
+            if deal_amount <= 0:
+                break
+    else:
+        for price, amount in book.levels(0):
+            bestBid = new_book.bestBid()
+            if (bestBid[0] < deal_price or bestBid[0] == float('nan')) and price < deal_price:
+                break
+            if bestBid[0] != float('nan') and (bestBid[0] > price or (bestBid[0] == price and strong)):
+                if bestBid[1] >= deal_amount:
+                    new_book.book[0][bestBid[0]] -= deal_amount
+                    position += deal_amount
+                    r_pnl -= deal_amount * bestBid[0]
+                    deal_amount = 0
+                else:
+                    del new_book.book[0][bestBid[0]]
+                    position += bestBid[1]
+                    r_pnl -= bestBid[1] * bestBid[0]
+                    deal_amount -= bestBid[1]
+            else:
+                deal_amount -= amount
+            if deal_amount <= 0:
+                break
+    return position, r_pnl
+
+
+def referenceCrossBook(book, new_book, position):
+    # loop of Backtester.finalize_book before the kernels
+    for price, value in book.levels(1):
+        bestBid = new_book.bestBid()
+        if bestBid[0] < price or math.isnan(bestBid[0]):
+            break
+        if bestBid[1] > value:
+            position += value
+            new_book.book[0][bestBid[0]] -= value
+        else:
+            position += bestBid[1]
+            del new_book.book[0][bestBid[0]]
+    for price, value in book.levels(0):
+        bestAsk = new_book.bestAsk()
+        if bestAsk[0] > price or math.isnan(bestAsk[0]):
+            break
+        if bestAsk[1] > value:
+            position -= value
+            new_book.book[1][bestAsk[0]] -= value
+        else:
+            position -= bestAsk[1]
+            del new_book.book[1][bestAsk[0]]
+    return position
+
+
+def randomBooks(rng, mid=60000, tick=5):
+    # market book deeper than Matching.LEVELS and trader's book around it, zero volumes included
+    book = OrderBook()
+    for side, sign in ((0, -1), (1, 1)):
+        for level in rng.choice(80, size=rng.randint(1, 60), replace=False):
+            book.book[side][mid + sign * (int(level) + 1) * tick] = int(rng.randint(1, 50))
+    trader = OrderBook()
+    for side, sign in ((0, -1), (1, 1)):
+        for level in rng.choice(np.arange(-20, 100), size=rng.randint(0, 4), replace=False):
+            trader.book[side][float(mid + sign * int(level) * tick)] = int(rng.randint(0, 400))
+    return book, trader
+
+
+def copyBook(book):
+    ret = OrderBook()
+    ret.book = book.book
+    return ret
+
+
+def sameBook(a, b):
+    return all(dict(a.book[side]) == dict(b.book[side]) for side in range(2))
+
+
+@pytest.mark.parametrize('strong', [False, True])
+def test_match_deal(jit, strong):
+    rng = np.random.RandomState(1)
+    for case in range(500):
+        book, trader = randomBooks(rng)
+        buySell = bool(rng.randint(2))
+        deal_amount = int(rng.randint(1, 1000))
+        deal_price = 60000 + int(rng.randint(-100, 100)) * 5
+        position, r_pnl = float(rng.randint(-50, 50)), float(rng.randint(-10**6, 10**6))
+        expected_book = copyBook(trader)
+        expected = referenceMatchDeal(book, expected_book, buySell, deal_amount, deal_price, position, r_pnl, strong)
+        result = matchDeal(book, trader, buySell, deal_amount, deal_price, position, r_pnl, strong)
+        assert result == expected, case
+        assert sameBook(trader, expected_book), case
+
+
+def test_cross_book(jit):
+    rng = np.random.RandomState(2)
+    for case in range(500):
+        book, trader = randomBooks(rng)
+        position = float(rng.randint(-50, 50))
+        expected_book = copyBook(trader)
+        expected = referenceCrossBook(book, expected_book, position)
+        assert crossBook(book, trader, position) == expected, case
+        assert sameBook(trader, expected_book), case
+
+
+@pytest.fixture(scope='module')
+def tapes():
+    return [Tape.fromFrame(syntheticFlow(20000, 20, seed)) for seed in range(2)]
+
+
+@pytest.mark.parametrize('value, offset', [(10, 10), (30, 0), (5, -10)])
+def test_backtester(jit, value, offset, tapes, monkeypatch):
+    # whole sessions with the kernels against the same run with the reference loops
+    def run(tape):
+        backtest = Backtester(None, SpreadStrategy(value, offset), tape=tape)
+        backtest.verbose = False
+        return backtest.run(len(tape))
+
+    for tape in tapes:
+        result = run(tape)
+        with monkeypatch.context() as patch:
+            patch.setattr('TradingGym.Backtester.matchDeal', referenceMatchDeal)
+            patch.setattr('TradingGym.Backtester.crossBook', referenceCrossBook)
+            expected = run(tape)
+        for a, b in zip(result, expected):
+            assert np.array_equal(a, b, equal_nan=True)
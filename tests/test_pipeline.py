@@ -0,0 +1,68 @@
+"""
+PipelinedBook against OrderBook on synthetic sessions
+"""
+from TradingGym.Backtester import Backtester
+from TradingGym.Benchmark import syntheticFlow
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Pipeline import PipelinedBook
+from TradingGym.Strategy import SpreadStrategy
+from TradingGym.Flags import ADD, BUY
+from TradingGym.Tape import Tape
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='module')
+def tape():
+    return Tape.fromFrame(syntheticFlow(20000, 20, 0))
+
+
+def replay(book, tape, ends):
+    idx = 0
+    for end in ends:
+        book.updateRange(tape, idx, end)
+        idx = end
+    return [dict(side) for side in book.book]
+
+
+@pytest.mark.parametrize('step', [1, 50, 300])
+def test_same_book(tape, step):
+    ends = list(range(step, len(tape), step)) + [len(tape)]
+    book = PipelinedBook(tape, batch=1000)
+    try:
+        assert replay(book, tape, ends) == replay(OrderBook(), tape, ends)
+    finally:
+        book.close()
+
+
+def test_negative_level_inside_range():
+    # level 100 goes to -5 and back to 5 within one long range
+    n = 100
+    flags = np.full(n, ADD | BUY, dtype=np.uint32)
+    prices = np.arange(n, dtype=np.int64) + 1000
+    amounts = np.ones(n, dtype=np.int64)
+    flags[1] = BUY # removes 10 of the 5 added
+    prices[:3] = 100
+    amounts[:3] = [5, 10, 10]
+    zeros = np.zeros(n, dtype=np.int64)
+    tape = Tape(ts=zeros, order_id=zeros, price=prices, amount=amounts, amount_rest=zeros,
+                deal_id=zeros, deal_price=zeros, oi=zeros, flags=flags)
+    with pytest.raises(RuntimeError):
+        OrderBook().updateRange(tape, 0, n)
+    book = PipelinedBook(tape)
+    try:
+        with pytest.raises(RuntimeError):
+            book.updateRange(tape, 0, n)
+    finally:
+        book.close()
+
+
+def test_backtester(tape):
+    results = []
+    for pipeline in (False, True):
+        backtest = Backtester(None, SpreadStrategy(10, 10), tape=tape)
+        backtest.verbose = False
+        backtest.pipeline = pipeline
+        results.append(backtest.run(len(tape)))
+    for expected, column in zip(*results):
+        assert np.array_equal(np.asarray(expected), np.asarray(column))
@@ -0,0 +1,38 @@
+"""
+Snapshots against books replayed up to every timestamp
+"""
+from TradingGym.Benchmark import syntheticFlow
+from TradingGym.OrderBook import OrderBook
+from TradingGym.Snapshots import snapshots
+from TradingGym.Tape import Tape
+from pandas import DatetimeIndex
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='module')
+def tape():
+    return Tape.fromFrame(syntheticFlow(5000, 20, 0))
+
+
+def timestamps(tape, rng):
+    return DatetimeIndex(np.sort(rng.choice(tape.ts, 50)))
+
+
+def test_snapshots(tape, tmp_path):
+    times = timestamps(tape, np.random.RandomState(0))
+    out = snapshots(tape, times, levels=3, path=str(tmp_path / 'books.npy'), chunksize=7)
+    for i, time in enumerate(times.values.view(np.int64)):
+        book = OrderBook()
+        book.updateRange(tape, 0, int(np.searchsorted(tape.ts, time)))
+        for side in range(2):
+            prices, amounts = book.top(side, 3)
+            assert out[i, side, :len(prices), 0].tolist() == list(prices)
+            assert out[i, side, :len(amounts), 1].tolist() == list(amounts)
+    assert np.array_equal(np.load(str(tmp_path / 'books.npy')), out)
+
+
+def test_unsorted_timestamps(tape):
+    times = timestamps(tape, np.random.RandomState(1))
+    with pytest.raises(ValueError):
+        snapshots(tape, times[::-1])
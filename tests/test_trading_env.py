@@ -0,0 +1,95 @@
+"""
+TradingEnv action models on a synthetic session
+"""
+from TradingGym.envs.trading_env import TradingEnv
+from TradingGym.Benchmark import syntheticFlow
+from TradingGym.Features import FeaturePipeline, TopLevels, Spread, OrderFlowImbalance, TradeVolume
+from TradingGym.Tape import Tape
+import numpy as np
+import pytest
+
+
+class OrderBookEnv(TradingEnv):
+    # overriding convertAction keeps the OrderBook path
+    def convertAction(self, action):
+        return super().convertAction(action)
+
+
+@pytest.fixture(scope='module')
+def tape():
+    return Tape.fromFrame(syntheticFlow(20000, 20, 0))
+
+
+def makeEnv(cls, tape):
+    env = cls()
+    env.init(None, '/synthetic', tape=tape)
+    env.reset()
+    return env
+
+
+def test_default_model_reads_env_attributes(tape):
+    env = makeEnv(TradingEnv, tape)
+    env.VOLUME = 3
+    env.DELTA_SEQ = [1000, 0, 0, 0, 0, 0, 0, 2000]
+    midPrice = env.replay.book.midPrice()
+    env.step(7) # far bid and ask, nothing is filled
+    book = env.trader_book.orderBook()
+    assert dict(book.book[0]) == {midPrice - 1000: 3}
+    assert dict(book.book[1]) == {midPrice + 2000: 3}
+
+
+def test_default_model_same_as_order_book(tape):
+    envs = [makeEnv(cls, tape) for cls in (TradingEnv, OrderBookEnv)]
+    traces = []
+    for env in envs:
+        env.VOLUME = 20
+        env.DELTA_SEQ = [-10, -5, 0, 5, 10, 20, 50, 100]
+        traces.append([env.step(action % 64)[:2] for action in range(0, 640, 7)])
+    assert traces[0] == traces[1]
+
+
+def featureEnv(tape, precompute):
+    env = TradingEnv()
+    env.EPISODE = 20
+    env.setFeatures(FeaturePipeline([TopLevels(3), Spread(), OrderFlowImbalance(), TradeVolume(5)]), precompute)
+    env.init(None, '/synthetic', tape=tape)
+    return env
+
+
+def test_precomputed_features_same_as_online(tape):
+    traces = []
+    for precompute in (False, True):
+        env = featureEnv(tape, precompute)
+        trace = []
+        for episode in range(3):
+            trace.append(env.reset().copy())
+            done = False
+            while not done:
+                observation, reward, done, info = env.step(9)
+                trace.append(observation.copy())
+        traces.append(np.array(trace))
+    assert np.array_equal(traces[0], traces[1])
+
+
+def test_precomputed_features_reject_seek(tape):
+    env = featureEnv(tape, True)
+    env.reset()
+    start = int(tape.ts[env.replay.trading_start]) + 12345678 # off the grid of steps
+    with pytest.raises(ValueError):
+        env.reset(start)
+    env.random_start = True
+    with pytest.raises(ValueError):
+        env.reset()
+
+
+def test_session_starts_over_from_tape(tape, capsys):
+    env = makeEnv(TradingEnv, tape)
+    info = {}
+    while not info.get('session_end'):
+        observation, reward, done, info = env.step(9)
+    assert done and info['key'] == '/synthetic'
+    assert env.tape is tape
+    assert env.replay.idx == env.replay.trading_start
+    env.reset()
+    env.step(9)
+    assert capsys.readouterr().out == ''